@@ -40,6 +40,19 @@ def popup_builder(name_filter_label: str, file_dialogue_function, selection_type
             ttk.OptionMenu(window, self.submission_type, self.submission_type.get(),
                            *['Base Files', 'Current Student Submissions', 'Past Student Submissions']).grid(column=1,
                                                                                                             row=3)
+            self.to_corpus = tk.BooleanVar(self, False)
+            corpus_check = ttk.Checkbutton(window, text='Keep in past student corpus', variable=self.to_corpus,
+                                           state=tk.DISABLED)
+            corpus_check.grid(column=2, row=3)
+
+            def _toggle_corpus(*_):
+                # Only past student submissions can be kept in the corpus
+                past = self.submission_type.get() == 'Past Student Submissions'
+                corpus_check.config(state=tk.NORMAL if past else tk.DISABLED)
+                if not past:
+                    self.to_corpus.set(False)
+
+            self.submission_type.trace_add('write', _toggle_corpus)
             if selection_type == 'checkmate':
                 ttk.Label(window, text='Enable directory mode for best results').grid(row=4, column=1)
 
@@ -78,6 +91,6 @@ def popup_builder(name_filter_label: str, file_dialogue_function, selection_type
                 return False
 
         def apply(self):
-            self.master.update_tree(*self.result)
+            self.master.update_tree(*self.result, to_corpus=self.to_corpus.get())
 
     return Popup
@@ -42,4 +42,5 @@ class EditSettingsPopup(TtkDialog):
             return False
 
     def apply(self):
+        self.parent.refilter_report()
         return self.result
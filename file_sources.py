@@ -0,0 +1,346 @@
+"""
+Tk-free discovery of submission files.
+Mirrors the selection types offered by the Files tab (single,
+directory, directory_of_zip, wildcard and checkmate) and their display
+name rules, so files can be gathered without building the GUI.
+"""
+import glob
+import json
+import os
+import pathlib
+import re
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import model
+
+SELECTION_TYPES = ('single', 'directory', 'directory_of_zip', 'wildcard', 'checkmate')
+
+
+class FileNode:
+    """
+    A row of the Files tab, held outside of the Treeview so the widget
+    only needs rows for the parts of the tree that have been expanded.
+    Leaves are files, every other node groups the files beneath it.
+    """
+    __slots__ = ('text', 'values', 'parent', 'children', 'item', 'populated', 'record')
+
+    def __init__(self, text: str, values=(), parent=None):
+        """
+        :param text: display name shown in the tree
+        :param values: values of the Treeview row (the path first)
+        :param parent: FileNode to attach this node to, if any
+        """
+        self.text = text
+        self.values = tuple(values)
+        self.parent = None
+        self.children = []
+        # Treeview item id, once the row has been inserted into the widget
+        self.item = None
+        # Whether the children's rows have been (or are being) inserted
+        self.populated = False
+        # model.FileRecord of a file node, once registered in a FileRegistry
+        self.record = None
+        if parent is not None:
+            self.attach(parent)
+
+    def attach(self, parent: 'FileNode'):
+        self.parent = parent
+        parent.children.append(self)
+
+    def detach(self):
+        if self.parent is not None:
+            self.parent.children.remove(self)
+            self.parent = None
+
+    def walk(self):
+        """
+        :return: generator of this node and all of its descendants, in tree order
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def leaves(self):
+        """
+        :return: generator of the file nodes beneath this node, in tree order
+        """
+        return (node for node in self.walk() if not node.children)
+
+
+class FileRegistry:
+    """
+    Flat index of the files to submit, kept per group in insertion order
+    so a submission can be built without walking any tree.
+    """
+
+    def __init__(self):
+        self._groups = {group: {} for group in model.FILE_GROUPS}
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self._groups.values())
+
+    def register(self, node: FileNode, group: str):
+        """
+        Creates and indexes a record for every file node beneath node,
+            keeping the StoredDigests of nodes built from a record (see PastCorpus.records).
+        :param node: FileNode holding the files
+        :param group: model.BASE, model.CURRENT or model.PAST
+        :return: None
+        """
+        records = self._groups[group]
+        for leaf in node.leaves():
+            # zip members are stored as (display path, zip path, member, size)
+            source = model.ZipMember(*leaf.values[1:]) if len(leaf.values) == 4 else str(leaf.values[0])
+            leaf.record = model.FileRecord(source, str(leaf.text).replace(' ', '_'), group,
+                                           leaf.record.digests if leaf.record is not None else None)
+            records[leaf.record] = None
+
+    def unregister(self, node: FileNode):
+        """
+        Drops the records of every file node beneath node.
+        :param node: FileNode previously registered
+        :return: None
+        """
+        for leaf in node.leaves():
+            if leaf.record is not None:
+                self._groups[leaf.record.group].pop(leaf.record, None)
+                leaf.record = None
+
+    def records(self, group: str = None) -> ['model.FileRecord']:
+        """
+        :param group: group to list, or None to list every group (base, current then past)
+        :return: list of FileRecord in insertion order
+        """
+        if group is not None:
+            return list(self._groups[group])
+        return [record for group in model.FILE_GROUPS for record in self._groups[group]]
+
+
+def _regex_name(regex: str, name: str) -> str:
+    match = re.match(regex, name) if regex else None
+    return match.group(1) if match else name
+
+
+def _keep(name: str, filename: [str]) -> bool:
+    return (name in filename or filename == ['']) and not name.startswith('._') and name != '.DS_Store'
+
+
+def split_filenames(filename: str) -> [str]:
+    """
+    :param filename: ';'-separated file names, as entered in the zip file dialogue
+    :return: list of stripped names ([''] when every file should be kept)
+    """
+    return [f.strip() for f in filename.split(';')]
+
+
+def zip_display_name(student: str, member: 'model.ZipMember', dir_mode=False) -> str:
+    """
+    :param student: display name of the student whose zip file holds the member
+    :param member: ZipMember of the submitted file
+    :param dir_mode: use the directory mode naming convention (student/file)
+    :return: display name of the member
+    """
+    return student + (f"/{pathlib.PurePosixPath(member.member).name}" if dir_mode else '')
+
+
+def list_submission(zip_path: str, filename: [str]) -> ['model.ZipMember']:
+    """
+    Lists the members of a zip file whose names are requested, without
+        extracting anything.
+    :param zip_path: path to the student's zip file
+    :param filename: names of the files to keep, or [''] to keep every file
+    :return: ZipMembers sorted by member name
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return [model.ZipMember(zip_path, member.filename, member.file_size)
+                for member in sorted(zip_ref.infolist(), key=(lambda info: info.filename))
+                if not member.is_dir() and _keep(pathlib.PurePosixPath(member.filename).name, filename)]
+
+
+def iter_zip_directory(path: str, regex: str, filename: [str], workers=None):
+    """
+    Reads the member lists of every zip file of a directory on a thread
+        pool, yielding each student as soon as their zip file is read.
+    :param path: directory holding one zip file per student
+    :param regex: display name regex run against each zip file's name
+    :param filename: names of the files to keep, or [''] to keep every file
+    :param workers: number of worker threads (defaults to ThreadPoolExecutor's default)
+    :return: generator of (student, zip_path, [ZipMember]) in completion order
+    """
+    submissions = [(submission, _regex_name(regex, submission.name))
+                   for submission in sorted(pathlib.Path(path).iterdir()) if zipfile.is_zipfile(submission)]
+    if not submissions:
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(list_submission, str(submission), filename): (student, str(submission))
+                   for submission, student in submissions}
+        for future in as_completed(futures):
+            student, submission = futures[future]
+            yield student, submission, future.result()
+
+
+def collect_files(path: str, display_name_or_regex: str, selection_type: str, filename='',
+                  dir_mode=False) -> [(str, str)]:
+    """
+    Finds the files a Files tab addition of the given selection type
+        would register.
+    :param path: file, directory or glob pattern, depending on selection_type
+    :param display_name_or_regex: display name for single files, the prefix for checkmate
+                                  directories, otherwise a regex whose group 1 is the display name
+    :param selection_type: one of SELECTION_TYPES
+    :param filename: ';'-separated names of the files to keep from each zip file (blank keeps all)
+    :param dir_mode: name zipped files with the directory mode naming convention (student/file)
+    :return: list of (file_path, display_name) in the order the Files tab would display them,
+             where files within zip files are given as model.ZipMember instead of a path
+    """
+    assert selection_type in SELECTION_TYPES, selection_type
+    if selection_type == 'wildcard':
+        return [(file, _regex_name(display_name_or_regex, file)) for file in glob.iglob(path, recursive=True)
+                if pathlib.Path(file).is_file()]
+
+    path = pathlib.Path(path)
+    if path.is_file():
+        return [(str(path), display_name_or_regex)]
+
+    files = []
+    if selection_type == 'directory_of_zip':
+        listed = sorted(iter_zip_directory(str(path), display_name_or_regex, split_filenames(filename)),
+                        key=(lambda submission: submission[1]))
+        files += [(found, zip_display_name(student, found, dir_mode))
+                  for student, _, found_files in listed for found in found_files]
+    elif selection_type == 'checkmate':
+        prefix = f"{display_name_or_regex}{'_' if display_name_or_regex else ''}"
+        for ucinetid in path.iterdir():
+            if ucinetid.name == '.DS_Store':
+                continue
+            for submission_part in ucinetid.iterdir():
+                if submission_part.name == '.DS_Store' or not submission_part.is_dir():
+                    continue
+                files += [(str(file), f"{prefix}{ucinetid.name}/{file.name}") for file in submission_part.iterdir()
+                          if file.is_file() and file.name != '.DS_Store']
+    else:
+        files += [(str(found_file), _regex_name(display_name_or_regex, found_file.name))
+                  for found_file in path.iterdir() if found_file.is_file() and found_file.name != '.DS_Store']
+    return files
+
+
+class PastCorpus:
+    """
+    Persistent index of past quarters' submissions, stored as JSON.
+    Sources (anything the Files tab can add) are crawled once when added;
+    afterwards refresh() lists them again and only reads the files that are
+    new or whose size or modification time changed, to store their digests
+    (see model.StoredDigests), and records() rebuilds the whole group from
+    the index without touching the sources.
+    """
+
+    def __init__(self, index_path=model.CORPUS_FILE):
+        """
+        :param index_path: JSON file holding the index (created on the first save)
+        """
+        self.index_path = pathlib.Path(index_path)
+        self._lock = threading.Lock()
+        try:
+            with self.index_path.open() as index_file:
+                self.sources = json.load(index_file)['sources']
+        except FileNotFoundError:
+            self.sources = []
+
+    def __len__(self) -> int:
+        return sum(len(source['files']) for source in self.sources)
+
+    def save(self):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.index_path.with_suffix('.tmp')
+        with self._lock, temp_path.open('w') as index_file:
+            json.dump({'sources': self.sources}, index_file)
+        os.replace(str(temp_path), str(self.index_path))
+
+    @staticmethod
+    def _stat(source) -> (int, float):
+        if isinstance(source, model.ZipMember):
+            return source.size, os.path.getmtime(source.archive)
+        stat = os.stat(source)
+        return stat.st_size, stat.st_mtime
+
+    def add_source(self, path: str, display_name_or_regex: str, selection_type: str, filename='', dir_mode=False,
+                   progress=None) -> (int, int, int):
+        """
+        Adds a source to the corpus (if it is not in it already) and indexes its files.
+        :param path: file, directory or glob pattern, as given to collect_files
+        :param display_name_or_regex: display name, prefix or regex, as given to collect_files
+        :param selection_type: one of SELECTION_TYPES
+        :param filename: ';'-separated names of the files to keep from each zip file
+        :param dir_mode: name zipped files with the directory mode naming convention
+        :param progress: optional callable receiving (files_checked, total_files)
+        :return: tuple of the number of (added, changed, removed) files
+        """
+        assert selection_type in SELECTION_TYPES, selection_type
+        # Sources are stored with absolute paths so the index does not depend on the working directory
+        path = os.path.abspath(os.path.expanduser(str(path)))
+        spec = {'path': path, 'name': display_name_or_regex, 'type': selection_type, 'filename': filename,
+                'dir_mode': dir_mode}
+        source = next((source for source in self.sources
+                       if all(source[key] == value for key, value in spec.items())), None)
+        if source is None:
+            source = dict(spec, files={})
+            with self._lock:
+                self.sources.append(source)
+        return self.refresh([source], progress)
+
+    def clear(self):
+        with self._lock:
+            self.sources = []
+        self.save()
+
+    def refresh(self, sources=None, progress=None) -> (int, int, int):
+        """
+        Brings the index up to date with the files of its sources: files
+            are only counted as changed when their size or modification time
+            differs, and only new or changed files are read to hash them.
+        :param sources: sources to refresh (defaults to every source)
+        :param progress: optional callable receiving (files_checked, total_files)
+        :return: tuple of the number of (added, changed, removed) files
+        """
+        added = changed = removed = 0
+        for source in (self.sources if sources is None else sources):
+            found = collect_files(source['path'], source['name'], source['type'], source['filename'],
+                                  source['dir_mode'])
+            indexed = source['files']
+            files = {}
+            for checked, (file_path, display_name) in enumerate(found, 1):
+                key = str(file_path)
+                size, mtime = self._stat(file_path)
+                entry = indexed.get(key)
+                if entry is None or entry['size'] != size or entry['mtime'] != mtime:
+                    added, changed = (added + 1, changed) if entry is None else (added, changed + 1)
+                    entry = {'path': file_path.archive if isinstance(file_path, model.ZipMember) else key,
+                             'member': file_path.member if isinstance(file_path, model.ZipMember) else None,
+                             'size': size, 'mtime': mtime}
+                if 'digests' not in entry:
+                    # Also hashes the unchanged entries of indexes written before digests were stored
+                    entry['digests'] = list(model.StoredDigests.of(file_path))
+                entry['display_name'] = display_name.replace(' ', '_')
+                files[key] = entry
+                if progress is not None:
+                    progress(checked, len(found))
+            removed += len(indexed.keys() - files.keys())
+            with self._lock:
+                source['files'] = files
+        self.save()
+        return added, changed, removed
+
+    def records(self) -> ['model.FileRecord']:
+        """
+        :return: a past student FileRecord for every indexed file, in the order the sources were added
+        """
+        with self._lock:
+            return [model.FileRecord(model.ZipMember(entry['path'], entry['member'], entry['size'])
+                                     if entry['member'] is not None else entry['path'],
+                                     entry['display_name'], model.PAST,
+                                     model.StoredDigests(*entry['digests']) if 'digests' in entry else None)
+                    for source in self.sources for entry in source['files'].values()]
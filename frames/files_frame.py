@@ -3,10 +3,10 @@ import tkinter.ttk as ttk
 import pathlib
 from tkinter import messagebox, filedialog
 import dialogue_boxes.dynamic_constructor as dynamic_constructor
-import glob
-import re
-import shutil
-import zipfile
+import model
+from collections import deque
+
+import file_sources
 
 SingleFile = dynamic_constructor.popup_builder('Display Name: ', filedialog.askopenfilename, 'single',
                                                'Add Single File')
@@ -25,11 +25,33 @@ CheckmatePath = dynamic_constructor.popup_builder('Prefix for Display Name', fil
 
 
 class TabFiles(ttk.PanedWindow):
+    # Number of rows inserted into the tree per event loop iteration
+    ROW_CHUNK = 250
+    GROUP_KEYS = {'Base Files': model.BASE,
+                  'Current Student Submissions': model.CURRENT,
+                  'Past Student Submissions': model.PAST}
+
     def __init__(self, master, **kwargs):
         self._single_file_root = None
         super().__init__(master, orient=tk.HORIZONTAL, **kwargs)
         self.file_display = ttk.Treeview(self, column='#1')
         self.add(self.file_display, weight=1)
+        # Treeview item id -> FileNode, for every row currently in the widget
+        self.nodes = {}
+        # Files to submit, per group
+        self.registry = file_sources.FileRegistry()
+        self._pending_rows = deque()
+        self._inserting = False
+        # Index of past quarters' submissions, shown as a single node of the past group
+        try:
+            self.corpus = file_sources.PastCorpus()
+        except (ValueError, KeyError) as e:
+            backup = model.CORPUS_FILE.with_suffix('.json.bak')
+            model.CORPUS_FILE.replace(backup)
+            messagebox.showwarning('Past Student Corpus', f'Could not read the past student corpus, it was moved to '
+                                                          f'{backup} and will be rebuilt:\n\n{e}')
+            self.corpus = file_sources.PastCorpus()
+        self.corpus_node = None
 
         def on_double_click(event):
             item = self.file_display.selection()
@@ -44,48 +66,42 @@ class TabFiles(ttk.PanedWindow):
                                                  default='cancel')
                 if confirm:
                     for i in item:
-                        if i in ('I001', 'I002', 'I003'):
-                            for child in self.file_display.get_children(i):
-                                file_path = pathlib.Path(self.file_display.item(child, "value")[0])
-                                if pathlib.Path(self.master.master.master.temp_dir) in {p for p in file_path.parents}:
-                                    if file_path.is_dir():
-                                        shutil.rmtree(file_path.absolute())
-                                    else:
-                                        file_path.unlink()
-                                self.file_display.delete(child)
+                        node = self.nodes.get(i)
+                        if node is None:
+                            continue
+                        if node in self.groups.values():
+                            for child in list(node.children):
+                                self._remove(child)
                         else:
-                            _delete_helper(i)
+                            _delete_helper(node)
 
-        def _delete_helper(item):
-            try:
-                file_path = pathlib.Path(self.file_display.item(item, "value")[0])
-            except tk.TclError:
+        def _delete_helper(node):
+            parent = node.parent
+            if parent is None:
                 return
-            if pathlib.Path(self.master.master.master.temp_dir) in {p for p in file_path.parents}:
-                if file_path.is_dir():
-                    shutil.rmtree(file_path.absolute())
-                else:
-                    file_path.unlink()
-            parent = self.file_display.parent(item)
             # Look at parent's children and determine if it only has the deleted object as a child
-            if {child for child in self.file_display.get_children(parent) if child != item} or parent in (
-                    'I001', 'I002', 'I003'):
-                for i in self.file_display.get_children(item):
-                    pass
-                    # check if path is in temp_dir, if not,
-                self.file_display.delete(item)
+            if len(parent.children) > 1 or parent in self.groups.values():
+                self._remove(node)
             # if it's an only child, check parent's dependencies and delete parent
             else:
                 _delete_helper(parent)
 
         self.file_display.bind("<Double-1>", on_double_click)
+        self.file_display.bind("<<TreeviewOpen>>", self._on_open)
 
         self.file_display.heading('#0', text='Display Name')
         self.file_display.heading('#1', text='Path')
 
-        self.treenode_base_files = self.file_display.insert('', 'end', text='Base Files')
-        self.treenode_current_subs = self.file_display.insert('', 'end', text='Current Student Submissions')
-        self.treenode_past_subs = self.file_display.insert('', 'end', text='Past Student Submissions')
+        self.groups = {}
+        for group in self.GROUP_KEYS:
+            node = file_sources.FileNode(group)
+            node.item = self.file_display.insert('', 'end', text=group)
+            node.populated = True
+            self.nodes[node.item] = node
+            self.groups[group] = node
+        self.treenode_base_files = self.groups['Base Files'].item
+        self.treenode_current_subs = self.groups['Current Student Submissions'].item
+        self.treenode_past_subs = self.groups['Past Student Submissions'].item
 
         buttons_panel = ttk.Labelframe(self, text='Add Files')
         self.add(buttons_panel)
@@ -104,122 +120,201 @@ class TabFiles(ttk.PanedWindow):
         ttk.Button(buttons_panel, text='Add Checkmate Directory', command=(lambda: CheckmatePath(self))).pack(
             anchor='nw', padx=buttons_padding_x,
             pady=buttons_padding_y)
+        ttk.Separator(buttons_panel).pack(fill='x', padx=buttons_padding_x, pady=buttons_padding_y)
+        ttk.Button(buttons_panel, text='Load Past Student Corpus', command=self.load_corpus).pack(
+            anchor='nw', padx=buttons_padding_x, pady=buttons_padding_y)
+        ttk.Button(buttons_panel, text='Update Past Student Corpus', command=self.update_corpus).pack(
+            anchor='nw', padx=buttons_padding_x, pady=buttons_padding_y)
+
+        if len(self.corpus):
+            self.load_corpus()
+
+    def _add(self, node: file_sources.FileNode, parent: file_sources.FileNode, group=None):
+        """
+        Attaches node to parent, registers its files under group (if given)
+            and makes it visible.
+        """
+        node.attach(parent)
+        if group is not None:
+            self.registry.register(node, group)
+        self._show(node)
+
+    def _show(self, node: file_sources.FileNode):
+        """
+        Makes a newly attached node visible: queues its row if its parent
+            is expanded, otherwise only makes sure the parent can be expanded.
+        """
+        parent = node.parent
+        if parent is None or parent.item is None:
+            return
+        if parent.populated:
+            self._pending_rows.append(node)
+            self._schedule_rows()
+        elif not self.file_display.get_children(parent.item):
+            self.file_display.insert(parent.item, 'end', text='Loading...')
+
+    def _schedule_rows(self):
+        if not self._inserting:
+            self._inserting = True
+            self.after_idle(self._insert_rows)
+
+    def _insert_rows(self):
+        for _ in range(min(self.ROW_CHUNK, len(self._pending_rows))):
+            node = self._pending_rows.popleft()
+            if node.item is not None or node.parent is None or node.parent.item is None:
+                continue
+            node.item = self.file_display.insert(node.parent.item, 'end', text=node.text, values=node.values)
+            self.nodes[node.item] = node
+            if node.children:
+                self.file_display.insert(node.item, 'end', text='Loading...')
+        if self._pending_rows:
+            self.after(1, self._insert_rows)
+        else:
+            self._inserting = False
+
+    def _on_open(self, event):
+        node = self.nodes.get(self.file_display.focus())
+        if node is None or node.populated:
+            return
+        node.populated = True
+        self.file_display.delete(*self.file_display.get_children(node.item))
+        self._pending_rows.extend(node.children)
+        self._schedule_rows()
+
+    def _remove(self, node: file_sources.FileNode):
+        """
+        Removes a node, and everything beneath it, from the registry and the tree.
+        """
+        item = node.item
+        self.registry.unregister(node)
+        node.detach()
+        for removed in node.walk():
+            if removed.item is not None:
+                self.nodes.pop(removed.item, None)
+                removed.item = None
+        if item is not None:
+            self.file_display.delete(item)
+
+    def load_corpus(self):
+        """
+        Replaces the past student corpus node with the files currently in the corpus index.
+        """
+        if self.corpus_node is not None and self.corpus_node.parent is not None:
+            self._remove(self.corpus_node)
+        self.corpus_node = None
+        records = self.corpus.records()
+        if not records:
+            return
+        self.corpus_node = file_sources.FileNode('Past Student Corpus', (self.corpus.index_path,))
+        for record in records:
+            source = record.path
+            node = file_sources.FileNode(record.display_name,
+                                         (str(source), source.archive, source.member, source.size)
+                                         if isinstance(source, model.ZipMember) else (source,), self.corpus_node)
+            # Registering the node keeps the record's digests
+            node.record = record
+        self._add(self.corpus_node, self.groups['Past Student Submissions'], model.PAST)
+
+    def _run_corpus_job(self, function, *args):
+        def _finished(counts):
+            self.load_corpus()
+            messagebox.showinfo('Past Student Corpus', 'Added {}, updated {} and removed {} files.'.format(*counts))
 
-    def update_tree(self, path, display_name_or_regex, file_type, selection_type, filename='', dir_mode=False):
+        def _failed(e):
+            messagebox.showerror('Error', f'Updating the past student corpus failed:\n\n{e}')
+
+        self.master.master.master.file_jobs.submit(lambda job: function(*args), on_done=_finished, on_error=_failed)
+
+    def add_to_corpus(self, path, display_name_or_regex, selection_type, filename='', dir_mode=False):
+        """
+        Indexes a source in the past student corpus in the background, then reloads the corpus node.
+        """
+        self._run_corpus_job(self.corpus.add_source, path, display_name_or_regex, selection_type, filename, dir_mode)
+
+    def update_corpus(self):
+        """
+        Re-indexes the new or modified files of every corpus source in the background.
+        """
+        self._run_corpus_job(self.corpus.refresh)
+
+    def update_tree(self, path, display_name_or_regex, file_type, selection_type, filename='', dir_mode=False,
+                    to_corpus=False):
         assert selection_type in ('single', 'directory', 'directory_of_zip', 'wildcard', 'checkmate'), selection_type
-        converter = {'Base Files': self.treenode_base_files,
-                     'Past Student Submissions': self.treenode_past_subs,
-                     'Current Student Submissions': self.treenode_current_subs}
-        if selection_type != 'wildcard':
-            path = pathlib.Path(path)
+        if to_corpus and self.GROUP_KEYS[file_type] == model.PAST:
+            self.add_to_corpus(path, display_name_or_regex, selection_type, filename, dir_mode)
+            return
+        group, group_key = self.groups[file_type], self.GROUP_KEYS[file_type]
+        location = pathlib.Path(path)
+        if selection_type == 'directory_of_zip' and not location.is_file():
+            # students are registered one at a time as their zip files are read
+            directory = file_sources.FileNode(location.name, (location,))
+            self._add(directory, group)
+            self._add_zip_directory(directory, group_key, location, display_name_or_regex,
+                                    file_sources.split_filenames(filename), dir_mode)
+            return
+        try:
+            # The display name rules are shared with moss_cli
+            files = file_sources.collect_files(str(path), display_name_or_regex, selection_type)
+        except OSError as e:
+            tk.messagebox.showerror('Error',
+                                    f'Aborting addition, ran into OSError:'
+                                    f'\n\n{e}\n\nEnsure You are using the correct file structure')
+            return
         if selection_type == 'wildcard':
-            wildcard = self.file_display.insert(converter[file_type], 'end', text=path, values=(path,))
-            regex = re.compile(display_name_or_regex)
-            for file in glob.iglob(path, recursive=True):
-                location = pathlib.Path(file)
-                name = file
-                name_temp = regex.match(name) if regex else None
-                name = name_temp.group(1) if name_temp else name.name if isinstance(name, pathlib.Path) else name
-                self.file_display.insert(wildcard, 'end', text=name, values=(location,))
-
-        elif path.is_file():
-            self.file_display.insert(converter[file_type], 'end', text=display_name_or_regex, values=(path,))
+            node = file_sources.FileNode(path, (path,))
+        elif location.is_file():
+            (file_path, display_name), = files
+            self._add(file_sources.FileNode(display_name, (file_path,)), group, group_key)
+            return
         else:
-            if selection_type != 'directory_of_zip':
-                directory = self.file_display.insert(converter[file_type], 'end',
-                                                     text=f"{display_name_or_regex}"
-                                                          f"{'_' if display_name_or_regex else ''}"
-                                                          f"{path.name}" if selection_type == 'checkmate' else path.name,
-                                                     values=(path,))
-            keep_directory = False
-            try:
-                if selection_type == 'directory_of_zip':
-                    filename = [f.strip() for f in filename.split(';')]
-                    temp_root = pathlib.Path(self.master.master.master.temp_dir).joinpath(path.name)
-                    temp_root.mkdir()
-                    directory = self.file_display.insert(converter[file_type], 'end',
-                                                         text=f"{display_name_or_regex}"
-                                                              f"{'_' if display_name_or_regex else ''}"
-                                                              f"{path.name}" if selection_type == 'checkmate' else path.name,
-                                                         values=(temp_root,))
-
-                    # loops through all submissions
-                    for submission in pathlib.Path.iterdir(path):
-                        if not zipfile.is_zipfile(submission):
-                            continue
+            node = file_sources.FileNode(f"{display_name_or_regex}"
+                                         f"{'_' if display_name_or_regex else ''}"
+                                         f"{location.name}" if selection_type == 'checkmate' else location.name,
+                                         (location,))
+        students = {}
+        for file_path, display_name in files:
+            parent = node
+            if selection_type == 'checkmate':
+                # Checkmate files are grouped by student (ucinetid/submission part/file)
+                student = pathlib.Path(file_path).parent.parent
+                parent = students.get(student)
+                if parent is None:
+                    parent = students[student] = file_sources.FileNode(student.name, (student,), node)
+            file_sources.FileNode(display_name, (file_path,), parent)
+        self._add(node, group, group_key)
 
-                        regex_match = re.match(display_name_or_regex, submission.name)
-                        student = submission.name if not regex_match else regex_match.group(1)
-
-                        temp_pointer = temp_root.joinpath(student)
-                        temp_pointer.mkdir()
-                        student_tree_branch = self.file_display.insert(directory, 'end',
-                                                                       text=student,
-                                                                       values=(temp_root.joinpath(student),))
-
-                        # unzips the code of current student
-
-                        zip_ref = zipfile.ZipFile(path.joinpath(submission), 'r')
-                        zip_ref.extractall(temp_pointer)
-                        zip_ref.close()
-
-                        def file_crawler(root: pathlib.Path):
-                            keep = sub_keep = False
-                            sub_dirs = []
-                            for located_path in root.iterdir():
-                                if located_path.is_dir():
-                                    sub_dirs.append(located_path)
-                                elif (
-                                        located_path.name in filename or filename == [
-                                        '']) and located_path.is_file() and not located_path.name.startswith(
-                                        '._') and located_path.name != '.DS_Store':
-                                    self.file_display.insert(student_tree_branch, 'end',
-                                                             text=student + (f"/{located_path.name}" if dir_mode else ''),
-                                                             values=(located_path,))
-                                    keep = True
-                            for located_path in sorted(sub_dirs):
-                                sub_keep = sub_keep or file_crawler(located_path)
-                            return sub_keep or keep
-
-                        keep_student = file_crawler(temp_pointer)
-                        keep_directory = keep_directory or keep_student
-
-                        if not keep_student:
-                            self.file_display.delete(student_tree_branch)
-                    if not keep_directory:
-                        self.file_display.delete(directory)
-                        messagebox.showwarning('No files found', 'No zip files were found within selected directory')
-                elif selection_type == 'checkmate':
-                    for ucinetid in pathlib.Path(path).iterdir():
-                        files_exist = False
-                        if ucinetid.name == '.DS_Store':
-                            continue
-                        name = ucinetid.name
-                        student = self.file_display.insert(directory, 'end', text=name, values=(ucinetid,))
-                        for submission_part in ucinetid.iterdir():
-                            if submission_part.name == '.DS_Store':
-                                continue
-                            for file in submission_part.iterdir():
-                                if file.is_file() and file.name != '.DS_Store':
-                                    self.file_display.insert(student, 'end',
-                                                             text=f"{display_name_or_regex}"
-                                                                  f"{'_' if display_name_or_regex else ''}"
-                                                                  f"{name}/{file.name}",
-                                                             values=(file,))
-                                    files_exist = True
-                        if not files_exist:
-                            self.file_display.delete(student)
-                else:
-                    for found_file in pathlib.Path(path).iterdir():
-                        if found_file.is_file() and found_file.name != '.DS_Store':
-                            name = re.match(display_name_or_regex, found_file.name)
-                            if name:
-                                name = name.group(1)
-                            else:
-                                name = found_file.name
-                            self.file_display.insert(directory, 'end', text=name, values=(found_file,))
-            except OSError as e:
-                self.file_display.delete(directory)
-                tk.messagebox.showerror('Error',
-                                        f'Aborting addition, ran into OSError:'
-                                        f'\n\n{e}\n\nEnsure You are using the correct file structure')
+    def _add_zip_directory(self, directory, group_key, path, regex, filename, dir_mode):
+        """
+        Reads the student zip files in the background and registers the
+            requested members of each one as soon as it has been read.
+            Members are stored as (display path, zip path, member, size)
+            and are streamed from the zip file when submitted.
+        """
+
+        def _list(job):
+            for student, submission, members in file_sources.iter_zip_directory(str(path), regex, filename):
+                job.report(student, submission, members)
+
+        def _insert_student(student, submission, members):
+            if not members or directory.parent is None:
+                return
+            student_node = file_sources.FileNode(student, (submission,))
+            for member in members:
+                file_sources.FileNode(file_sources.zip_display_name(student, member, dir_mode),
+                                      (str(member), member.archive, member.member, member.size), student_node)
+            self._add(student_node, directory, group_key)
+
+        def _finished(_):
+            if not directory.children and directory.parent is not None:
+                self._remove(directory)
+                messagebox.showwarning('No files found', 'No zip files were found within selected directory')
+
+        def _failed(e):
+            if directory.parent is not None:
+                self._remove(directory)
+            messagebox.showerror('Error',
+                                 f'Aborting addition, ran into an error:'
+                                 f'\n\n{e}\n\nEnsure You are using the correct file structure')
+
+        self.master.master.master.file_jobs.submit(_list, on_progress=_insert_student, on_done=_finished,
+                                                   on_error=_failed)
@@ -4,6 +4,7 @@ from tkinter import filedialog, messagebox
 import inspect
 from collections import defaultdict
 import pathlib
+import model
 
 try:
     from scripts.partner_converter import partner_formatter
@@ -14,7 +15,7 @@ except ImportError:
         'Error importing custom partner formatting script from scripts.partner_converter @ func: partner_formatter\n'
         'Loading default handler...')
     FAILED_IMPORT = True
-    partner_formatter = (lambda path_to_csv: eval(open(path_to_csv).read()))
+    from partner_files import load_partners as partner_formatter
 
 
 class TabPartners(ttk.Frame):
@@ -48,7 +49,8 @@ class TabPartners(ttk.Frame):
                       text='Error importing custom partner formatting script from\n'
                            '    scripts.partner_converter @func: partner_formatter\n'
                            'Loading default handler...\n'
-                           'Default Handler assumes the file is formatted properly and needs no parsing.\n'
+                           'Default Handler reads a student and their partner per row of a CSV or TSV file,\n'
+                           '    a class roster (of the assignment numbers entered), or a JSON list of pairs.\n'
                            '    If necessary, edit the script and reload the program.\n'
                            '    See the HELP doc. in the info menu for more information.').pack()
         dynamic_kwargs = defaultdict((lambda: tk.StringVar(self)))
@@ -72,8 +74,8 @@ class TabPartners(ttk.Frame):
                 else:
                     dynamic_kwargs['path_to_csv'] = partners_file
                     try:
-                        self.master.master.master.partners = partner_formatter(
-                            **{argument: string_var.get() for argument, string_var in dynamic_kwargs.items()})
+                        self.master.master.master.partners = model.PartnerIndex.of(partner_formatter(
+                            **{argument: string_var.get() for argument, string_var in dynamic_kwargs.items()}))
                     except BaseException as e:
                         messagebox.showerror(type(e),
                                              message=f"The parsing script at scripts.partner_converter raised the error"
@@ -99,5 +101,5 @@ class TabPartners(ttk.Frame):
 
     def _clear_partners(self):
         if messagebox.askokcancel(title='Clear Partners', message='Are you sure you want to clear all partners?'):
-            self.master.master.master.partners = {}
+            self.master.master.master.partners = model.PartnerIndex()
             self._repopulate_tree()
@@ -1,3 +1,5 @@
+import model
+
 import tkinter as tk
 import tkinter.ttk as ttk
 
@@ -38,6 +40,13 @@ class TabSettings(ttk.Frame):
                                                        variable=self.directory_mode_var)
         self.directory_mode_checkbox.pack(padx=5, pady=2.5, anchor='nw')
 
+        ttk.Label(sub_handler, text='Past Student Shards:', justify='left').pack(padx=5, pady=2.5, anchor='nw')
+        # Older config files do not have this setting
+        self.past_shards = tk.IntVar(self, self.master.master.master.user_config.get('past_shards', 1))
+        vcmd_shards = (self.register(self._validate_shards), '%P', '%S')
+        ttk.Spinbox(sub_handler, from_=1, to=16, textvariable=self.past_shards, validate='key',
+                    validatecommand=vcmd_shards).pack(padx=5, pady=2.5, anchor='nw')
+
         report_handler = ttk.Labelframe(self, text='Report')
         report_handler.pack(expand=1, fill='both', side='right', padx=10, pady=5)
 
@@ -72,6 +81,25 @@ class TabSettings(ttk.Frame):
                                           state=tk.ACTIVE if self.archive_locally.get() else tk.DISABLED)
         self.zip_button.pack(padx=40, pady=2.5, anchor='nw')
 
+        ttk.Label(report_handler, text='Matches per Report Page (0 for a single page):').pack(padx=5, pady=2.5,
+                                                                                              anchor='nw')
+        # Older config files do not have this setting
+        self.report_page_size = tk.IntVar(self, self.master.master.master.user_config.get('report_page_size', 0))
+        vcmd_page = (self.register(self._validate_page_size), '%P', '%S')
+        ttk.Spinbox(report_handler, values=[0, 100, 250, 500, 1000, 2500, 5000], textvariable=self.report_page_size,
+                    validate='key', validatecommand=vcmd_page).pack(padx=5, pady=2.5, anchor='nw')
+
+        ttk.Label(report_handler, text='Export Alongside report.html:').pack(padx=5, pady=2.5, anchor='nw')
+        exports = self.master.master.master.user_config.get('report_exports', [])
+        self.report_exports = {export_format: tk.BooleanVar(self, export_format in exports)
+                               for export_format in model.EXPORT_FORMATS}
+        for export_format, text in zip(model.EXPORT_FORMATS, ('JSON Lines', 'CSV', 'Report Snapshot')):
+            ttk.Checkbutton(report_handler, text=text, variable=self.report_exports[export_format]).pack(
+                padx=20, pady=2.5, anchor='nw')
+
+    def selected_exports(self) -> [str]:
+        return [export_format for export_format, selected in self.report_exports.items() if selected.get()]
+
     def validate_spin(self, total_string, single_change):
         if not total_string:
             self.network_threshold.set(0)
@@ -92,6 +120,26 @@ class TabSettings(ttk.Frame):
             self.bell()
             return False
 
+    def _validate_shards(self, total_string, single_change):
+        if not total_string:
+            self.past_shards.set(1)
+            return True
+        if single_change.isdigit() and total_string and 1 <= int(total_string) <= 16:
+            return True
+        else:
+            self.bell()
+            return False
+
+    def _validate_page_size(self, total_string, single_change):
+        if not total_string:
+            self.report_page_size.set(0)
+            return True
+        if single_change.isdigit() and total_string and 0 <= int(total_string) <= 1000000:
+            return True
+        else:
+            self.bell()
+            return False
+
     def _validate_id(self, total_string, single_change):
         if not total_string:
             self.moss_id.set(0)
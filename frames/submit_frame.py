@@ -1,5 +1,6 @@
 import model
 
+from collections import deque
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import filedialog
@@ -8,10 +9,27 @@ from dialogue_boxes.edit_settings import EditSettingsPopup
 
 
 class TabSubmit(ttk.Frame):
+    # Number of rows inserted into the report tree per event loop iteration
+    ROW_CHUNK = 250
+    # Number of names suggested while typing in the search box
+    COMPLETIONS = 50
+
     def __init__(self, master, **kwargs):
         padding = 5
         super().__init__(master, **kwargs)
+        # Rows waiting to be inserted, as (parent item, iterator of (text, values, network rows or None))
+        self._pending_rows = deque()
+        self._inserting = False
+        # Network items not opened yet, with the rows of their matches
+        self._unopened = {}
+        # Entries shown in the report tree and their model.ReportIndex, built on the first search
+        self._entries = []
+        self._index = None
+        # Networks of entries given as a list (see update_tree)
+        self._networks = []
         self.last_filtered_url = None
+        # model.ReportSnapshot of the last filtered report, so it is not read again when archived
+        self.last_snapshot = None
         self._save_dir = None
 
         # Tree config
@@ -25,6 +43,27 @@ class TabSubmit(ttk.Frame):
         self.report_tree.heading('P', text='Partnered')
         self.report_tree.heading('%', text='Matched')
         self.report_tree.grid(column=0, row=0, rowspan=2, sticky='news')
+        self.report_tree.bind('<<TreeviewOpen>>', self._on_open)
+
+        # Search
+        search_pane = ttk.Frame(self)
+        search_pane.grid(column=0, row=2, sticky='ew')
+        ttk.Label(search_pane, text='Find Student:').pack(side='left', padx=padding)
+        self.search_var = tk.StringVar(self)
+        self.search_var.trace_add('write', self._type_ahead)
+        self.search_box = ttk.Combobox(search_pane, textvariable=self.search_var, width=15)
+        self.search_box.bind('<Return>', self.show_student_networks)
+        self.search_box.bind('<<ComboboxSelected>>', self.show_student_networks)
+        self.search_box.pack(side='left')
+        ttk.Button(search_pane, text='Show Networks', command=self.show_student_networks).pack(side='left',
+                                                                                               padx=padding)
+        self.top_count = tk.IntVar(self, 25)
+        ttk.Spinbox(search_pane, from_=1, to=1000, textvariable=self.top_count, width=5).pack(side='left')
+        self.top_by = tk.StringVar(self, 'Lines')
+        ttk.Combobox(search_pane, textvariable=self.top_by, values=('Lines', 'Percentage'), state='readonly',
+                     width=10).pack(side='left', padx=padding)
+        ttk.Button(search_pane, text='Top Matches', command=self.show_top_matches).pack(side='left', padx=padding)
+        ttk.Button(search_pane, text='Show All', command=(lambda: self.update_tree(self._entries))).pack(side='left')
 
         # Stats / Errors
         error_pane = ttk.Frame(self)
@@ -74,6 +113,9 @@ class TabSubmit(ttk.Frame):
         ttk.Button(process_submission, text='Archive Report', command=self.archive_url_report).grid(column=0, row=2,
                                                                                                     padx=padding,
                                                                                                     pady=padding)
+        ttk.Button(process_submission, text='Open Snapshot...', command=self.open_snapshot).grid(column=0, row=3,
+                                                                                                 padx=padding,
+                                                                                                 pady=padding)
 
         self.use_active_partners = tk.BooleanVar(self, False)
         self.use_active_files = tk.BooleanVar(self, False)
@@ -104,48 +146,198 @@ class TabSubmit(ttk.Frame):
         self.rowconfigure(1, weight=1)
 
     def update_tree(self, passed_entries=None):
-        for item in self.report_tree.get_children():
-            self.report_tree.delete(item)
-        net_num = 1
-        search_tree = self.master.master.master.moss.template_values.get('entries',
-                                                                         []) if passed_entries is None else passed_entries
-        if search_tree:
-            network = self.report_tree.insert('', 'end', text='Network 1')
+        """
+        Shows the networks of a report. Only a row per network is inserted
+            (ROW_CHUNK rows per event loop iteration); the rows of its
+            matches are inserted when the network is first opened.
+        :param passed_entries: model.ReportEntries, or list of entries with None after each network
+                               (defaults to the entries of the last submission)
+        :return: None
+        """
+        entries = self.master.master.master.moss.template_values.get('entries', []) if passed_entries is None \
+            else passed_entries
+        if entries is not self._entries:
+            self._entries = entries
+            self._index = None
+        if isinstance(entries, model.ReportEntries):
+            networks = range(len(entries.networks))
         else:
-            network = None
-        for index, match in enumerate(search_tree):
-            if match is None:
-                if index == len(search_tree) - 1:
-                    continue
-                net_num += 1
-                network = self.report_tree.insert('', 'end', text=f'Network {net_num}')
+            self._networks = [[]]
+            for match in entries:
+                if match is None:
+                    self._networks.append([])
+                else:
+                    self._networks[-1].append(match)
+            self._networks = [network for network in self._networks if network]
+            networks = range(len(self._networks))
+        self._show((f'Network {group_num + 1}', (), self._network_rows(group_num)) for group_num in networks)
+
+    def _network_rows(self, group_num: int):
+        """
+        :return: iterable of the entries of a network of the shown report
+        """
+        if isinstance(self._entries, model.ReportEntries):
+            return (self._entries.entry(group_num, position) for position in self._entries.networks[group_num])
+        return self._networks[group_num]
+
+    def _show(self, rows):
+        """
+        Replaces the rows of the report tree.
+        :param rows: iterable of top level rows as (text, values, entries of the row's children or None)
+        :return: None
+        """
+        self.report_tree.delete(*self.report_tree.get_children())
+        self._pending_rows.clear()
+        self._unopened = {}
+        self._pending_rows.append(('', rows))
+        self._schedule_rows()
+
+    def _report_index(self):
+        if self._index is None and isinstance(self._entries, model.ReportEntries):
+            self._index = model.ReportIndex(self._entries)
+        return self._index
+
+    def _type_ahead(self, *_):
+        index = self._report_index()
+        prefix = self.search_var.get().strip()
+        self.search_box.config(values=index.complete(prefix, self.COMPLETIONS) if index is not None and prefix else ())
+
+    def show_student_networks(self, event=None):
+        """
+        Shows only the networks holding a student whose name starts with the search box's text.
+        :return: None
+        """
+        index = self._report_index()
+        prefix = self.search_var.get().strip()
+        if index is None or not prefix:
+            self.update_tree(self._entries)
+            return
+        networks = index.networks_of(prefix)
+        self.stats_var.set(f'{len(networks)} network(s) with a student starting with {prefix}')
+        self._show((f'Network {group_num + 1}', (), self._network_rows(group_num)) for group_num in networks)
+
+    def show_top_matches(self):
+        """
+        Shows the matches of the report with the most lines matched (or the
+            highest percentage, as chosen beside the button), best first.
+        :return: None
+        """
+        index = self._report_index()
+        if index is None:
+            return
+        try:
+            count = self.top_count.get()
+        except tk.TclError:
+            self.bell()
+            return
+        entries = self._entries
+        by = 'perc' if self.top_by.get() == 'Percentage' else 'lines'
+        self._show((entry.student1, (entry.student2, entry.partnered, entry.lines), None)
+                   for entry in (entries.entry(group_num, position) for group_num, position in index.top(count, by)))
+
+    def _schedule_rows(self):
+        if not self._inserting:
+            self._inserting = True
+            self.after_idle(self._insert_rows)
+
+    def _insert_rows(self):
+        inserted = 0
+        while self._pending_rows and inserted < self.ROW_CHUNK:
+            parent, rows = self._pending_rows[0]
+            for text, values, network in rows:
+                item = self.report_tree.insert(parent, 'end', text=text, values=values)
+                if network is not None:
+                    self._unopened[item] = network
+                    self.report_tree.insert(item, 'end', text='Loading...')
+                inserted += 1
+                if inserted == self.ROW_CHUNK:
+                    break
             else:
-                self.report_tree.insert(network, 'end', text=match['student1'],
-                                        values=(match['student2'], match['partnered'], match['lines']))
+                self._pending_rows.popleft()
+        if self._pending_rows:
+            self.after(1, self._insert_rows)
+        else:
+            self._inserting = False
+
+    def _on_open(self, event):
+        item = self.report_tree.focus()
+        network = self._unopened.pop(item, None)
+        if network is None:
+            return
+        self.report_tree.delete(*self.report_tree.get_children(item))
+        # Opened networks are inserted before the networks still waiting
+        self._pending_rows.appendleft((item, ((match.student1, (match.student2, match.partnered, match.lines), None)
+                                              for match in network)))
+        self._schedule_rows()
+
+    def refilter_report(self):
+        """
+        Applies the Settings tab's network threshold and the active partners
+            to the submitted report, reusing its parsed networks.
+        :return: None
+        """
+        moss = self.master.master.master.moss
+        if moss.snapshot is not None:
+            self.update_tree(moss.refilter(self.master.master.master.partners,
+                                           self.master.master.master.tab_settings.network_threshold.get()))
 
     def _select_report_directory(self):
         selected_file = filedialog.askdirectory()
         if selected_file:
             self.dir_var.set(selected_file)
 
-    def filter_url_report(self):
+    def open_snapshot(self):
+        snapshot_path = filedialog.askopenfilename(filetypes=[('Report Snapshot', '*.snapshot'),
+                                                              ('All Files', '*')])
+        if snapshot_path:
+            self.filter_url_report(snapshot_path)
+
+    def filter_url_report(self, snapshot_path=None):
+        """
+        Filters the report at the url entered (or the report saved in a
+            snapshot) in the background, then shows it in the report view.
+        :param snapshot_path: optional report.snapshot file to filter instead of the entered url
+        :return: None
+        """
         m = model.MossUCI(self.master.master.master.tab_settings.moss_id.get(),
                           self.master.master.master.tab_settings.language.get())
-        m.debug = self.master.master.master.menus.debug_mode
+        m.debug = self.master.master.master.menus.debug_mode.get()
+        m.report_page_size = self.master.master.master.tab_settings.report_page_size.get()
         m.sent = True
-        m.url = self.master.master.master.url_var.get()
+        # A sharded submission lists the url of every shard's report
+        m.shard_urls = [url.rstrip('/') for url in self.master.master.master.url_var.get().split()]
+        m.url = m.shard_urls[0] if m.shard_urls else ''
+        m.snapshot = self.last_snapshot
         if self.use_active_files.get():
             m.current_quarter_students = self.master.master.master.moss.current_quarter_students
         else:
             m.deactivate_current_students()
         partners = self.master.master.master.partners if self.use_active_partners.get() else ()
-        try:
-            m.filter_report(path=self.master.master.master.temp_dir, partners=partners, archive=False, zip_report=False,
-                            network_threshold=self.network_threshold.get(), to_filter=True)
+        network_threshold = self.network_threshold.get()
+        temp_dir = self.master.master.master.temp_dir
+        if snapshot_path is None and m.snapshot is not None and m.snapshot.urls == m.shard_urls:
+            # Already parsed: only the networks kept need to be selected again
+            self.update_tree(m.refilter(partners, network_threshold))
             self.last_filtered_url = m.url
-        except (ValueError, ConnectionError) as e:
-            messagebox.showerror('Error', e)
-        self.update_tree(m.template_values.get('entries', []))
+            return
+
+        def _filter(job):
+            if snapshot_path is not None:
+                m.load_snapshot(snapshot_path)
+            m.filter_report(path=temp_dir, partners=partners, archive=False, zip_report=False,
+                            network_threshold=network_threshold, to_filter=True, checkpoint=job.checkpoint)
+            return m
+
+        def _finished(moss):
+            self.last_filtered_url = moss.url
+            self.last_snapshot = moss.snapshot
+            if snapshot_path is not None:
+                self.master.master.master.url_var.set(' '.join(moss.shard_urls))
+            self._stop_progress()
+            self.update_tree(moss.template_values.get('entries', []))
+
+        self.progress_bar.start(10)
+        self.master.master.master.jobs.submit(_filter, on_done=_finished, on_error=self._report_error)
 
     def archive_url_report(self):
         save_dir = filedialog.askdirectory()
@@ -153,18 +345,22 @@ class TabSubmit(ttk.Frame):
             return
         else:
             self._save_dir = save_dir
-            self.master.master.master.after(10, self._archive_helper)
+            self._archive_helper()
 
     def _archive_helper(self):
         save_dir = self._save_dir
-        url = self.master.master.master.url_var.get()
-        url = url[:-1] if url.endswith('/') else url
+        shard_urls = [url.rstrip('/') for url in self.master.master.master.url_var.get().split()]
+        url = shard_urls[0] if shard_urls else ''
         filtered = url == self.last_filtered_url
         m = model.MossUCI(self.master.master.master.tab_settings.moss_id.get(),
                           self.master.master.master.tab_settings.language.get())
-        m.debug = self.master.master.master.menus.debug_mode
+        m.debug = self.master.master.master.menus.debug_mode.get()
+        m.report_page_size = self.master.master.master.tab_settings.report_page_size.get()
         m.sent = True
         m.url = url
+        m.shard_urls = shard_urls
+        m.snapshot = self.last_snapshot
+        m.export_formats = self.master.master.master.tab_settings.selected_exports()
         if filtered:
             if self.use_active_files.get():
                 m.current_quarter_students = self.master.master.master.moss.current_quarter_students
@@ -174,9 +370,28 @@ class TabSubmit(ttk.Frame):
         else:
             partners = ()
             m.deactivate_current_students()
-        try:
+        network_threshold = self.network_threshold.get()
+
+        def _archive(job):
             m.filter_report(path=save_dir, partners=partners, archive=True, zip_report=False,
-                            network_threshold=self.network_threshold.get(), to_filter=True)
-        except (ValueError, ConnectionError) as e:
-            messagebox.showerror('Error', e)
-        self.update_tree(m.template_values.get('entries', []))
+                            network_threshold=network_threshold, to_filter=True,
+                            progress=(lambda completed, total, _: job.report(completed, total)),
+                            checkpoint=job.checkpoint)
+            return m
+
+        def _finished(moss):
+            self._stop_progress()
+            self.update_tree(moss.template_values.get('entries', []))
+
+        self.progress_bar.start(10)
+        self.master.master.master.jobs.submit(_archive, on_progress=self.master.master.master.show_progress,
+                                              on_done=_finished, on_error=self._report_error)
+
+    def _stop_progress(self):
+        self.progress_bar.stop()
+        self.progress_bar.config(value=0)
+        self.stats_var.set('')
+
+    def _report_error(self, error: BaseException):
+        self._stop_progress()
+        messagebox.showerror('Error', error)
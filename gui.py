@@ -5,6 +5,7 @@ from tkinter import messagebox
 
 import model
 import json
+from job_runner import JobRunner
 from tempfile import TemporaryDirectory
 
 from frames.welcome_page import WelcomePage
@@ -19,7 +20,12 @@ from dialogue_boxes.text_dialogue import TextPopup
 class UciMossGui(tk.Tk):
     def __init__(self, *args, **kwargs):
         self.temp_dir = None
-        self.partners = {}
+        self.partners = model.PartnerIndex()
+        self.jobs = JobRunner()
+        # Listing the Files tab's sources never waits behind a submission or report
+        self.file_jobs = JobRunner()
+        self._submission = None
+        self._waiting_for_files = None
         self.user_config = {}
         self.load_saved_settings()
         self.moss = model.MossUCI(self.user_config['moss_id'], self.user_config['language'])
@@ -52,6 +58,20 @@ class UciMossGui(tk.Tk):
                           state=tk.NORMAL if self.user_config['filter'] else tk.DISABLED)
         self.notebook.add(self.tab_submit, text='Submission')
         self.notebook.pack(expand=1, fill='both')
+        self._poll_jobs()
+
+    def _poll_jobs(self):
+        self.jobs.poll()
+        self.file_jobs.poll()
+        self.after(50, self._poll_jobs)
+
+    def show_progress(self, completed: int, total: int, stage='Downloading report', *_):
+        """
+        Switches the submission progress bar to a determinate display of completed out of total.
+        """
+        self.tab_submit.progress_bar.stop()
+        self.tab_submit.progress_bar.config(value=100 * completed / total if total else 0)
+        self.tab_submit.stats_var.set(f'{stage}: {int(100 * completed / total) if total else 0}%')
 
     def load_saved_settings(self):
         try:
@@ -80,6 +100,9 @@ class UciMossGui(tk.Tk):
             "review_before_archiving": self.tab_submit.review_before.get(),
             "download_report": self.tab_settings.download_report.get(),
             "directory_mode": self.tab_settings.directory_mode_var.get(),
+            "past_shards": self.tab_settings.past_shards.get(),
+            "report_page_size": self.tab_settings.report_page_size.get(),
+            "report_exports": self.tab_settings.selected_exports(),
             "theme": self.style.theme_use()
         }
         with open('config.json', 'w') as config_file:
@@ -98,6 +121,9 @@ class UciMossGui(tk.Tk):
             "review_before_archiving": False,
             "download_report": False,
             "directory_mode": False,
+            "past_shards": 1,
+            "report_page_size": 0,
+            "report_exports": [],
             "theme": "clam"
         }
         self.tab_settings.moss_id.set(self.user_config['moss_id'])
@@ -111,6 +137,10 @@ class UciMossGui(tk.Tk):
         self.tab_settings.ignore_limit.set(self.user_config['ignore_limit'])
         self.tab_settings.download_report.set(self.user_config['download_report'])
         self.tab_settings.directory_mode_var.set(self.user_config['directory_mode'])
+        self.tab_settings.past_shards.set(self.user_config['past_shards'])
+        self.tab_settings.report_page_size.set(self.user_config['report_page_size'])
+        for export_format, selected in self.tab_settings.report_exports.items():
+            selected.set(export_format in self.user_config['report_exports'])
         self.welcome_page.disable_welcome_var.set(self.user_config['disable_welcome'])
         self.tab_submit.review_before.set(self.user_config['review_before_archiving'])
         self.tab_submit.review_button.config(state=tk.DISABLED)
@@ -134,6 +164,8 @@ class UciMossGui(tk.Tk):
                 f"{int(width)}x{int(height)}+{int(self.winfo_screenwidth() / 2 - width / 2)}+"
                 f"{int(self.winfo_screenheight() / 2 - height / 2)}")
             self.mainloop()
+            self.jobs.cancel_all()
+            self.file_jobs.cancel_all()
             self.save_settings()
 
     def validate_and_send(self):
@@ -144,9 +176,16 @@ class UciMossGui(tk.Tk):
         self.tab_submit.unlock.config(state=tk.ACTIVE)
         self.tab_submit.submit.config(state=tk.DISABLED)
         self.tab_submit.progress_bar.start(10)
-        self.after(1, self._validate_helper)
+        self._waiting_for_files = self.after(1, self._validate_helper)
 
     def _validate_helper(self):
+        if self.file_jobs.busy:
+            # Sources still being listed by the Files tab are not in its registry yet
+            self.tab_submit.stats_var.set('Waiting for the Files tab to finish listing sources...')
+            self._waiting_for_files = self.after(100, self._validate_helper)
+            return
+        self._waiting_for_files = None
+        self.tab_submit.stats_var.set('')
         config = {
             "moss_id": self.tab_settings.moss_id.get(),
             "language": self.tab_settings.language.get(),
@@ -158,33 +197,56 @@ class UciMossGui(tk.Tk):
             "review_before_archiving": self.tab_submit.review_before.get(),
             "download_report": self.tab_settings.download_report.get(),
             "directory": self.tab_submit.dir_var.get(),
-            "directory_mode": 1 if self.tab_settings.directory_mode_var.get() else 0
+            "directory_mode": 1 if self.tab_settings.directory_mode_var.get() else 0,
+            "past_shards": self.tab_settings.past_shards.get(),
+            "report_page_size": self.tab_settings.report_page_size.get(),
+            "report_exports": self.tab_settings.selected_exports()
         }
         self.moss = model.MossUCI(config['moss_id'], config['language'])
-        self.moss.debug = self.menus.debug_mode
+        self.moss.debug = self.menus.debug_mode.get()
         self.moss.setIgnoreLimit(config['ignore_limit'])
         self.moss.setDirectoryMode(config['directory_mode'])
-
-        def sifter(tree_item, add_function):
-            if self.tab_files.file_display.get_children(tree_item):
-                for sub_item in self.tab_files.file_display.get_children(tree_item):
-                    sifter(sub_item, add_function)
-            else:
-                add_function(self.tab_files.file_display.item(tree_item, "values")[0],
-                             self.tab_files.file_display.item(tree_item, "text").replace(' ', r'_'))
-
-        for item in self.tab_files.file_display.get_children('I001'):
-            sifter(item, self.moss.addBaseFile)
-        for item in self.tab_files.file_display.get_children('I002'):
-            sifter(item, self.moss.addFile)
-        for item in self.tab_files.file_display.get_children('I003'):
-            sifter(item, self.moss.add_old_students)
-
+        self.moss.shards = config['past_shards']
+        self.moss.report_page_size = config['report_page_size']
+        self.moss.export_formats = config['report_exports']
+
+        self.moss.add_records(self.tab_files.registry.records())
+
+        if not config['review_before_archiving'] and not config['download_report']:
+            config['directory'] = self.temp_dir
+        self._submission = self.jobs.submit(self._submit_job, self.moss, config, self.partners, self.temp_dir,
+                                            on_progress=self.show_progress,
+                                            on_done=(lambda url: self._submit_finished(url, config)),
+                                            on_error=self._submit_failed)
+
+    @staticmethod
+    def _submit_job(job, moss: model.MossUCI, config: dict, partners, temp_dir: str) -> str:
+        """
+        Runs on a JobRunner thread: sends the submission and filters the returned report.
+        Must not touch any tkinter object.
+        """
         try:
-            url = self.moss.send()
+            url = moss.send(progress=(lambda sent, total, _: job.report(sent, total, 'Uploading')))
         except ConnectionError:
             url = 'Error: Connection Disconnected by Host'
         # Is it a valid report?
+        if url.startswith('Error') or not url:
+            return url
+        job.checkpoint()
+        if not config['review_before_archiving']:  # Handle now...
+            moss.filter_report(path=config['directory'], partners=partners,
+                               archive=config['archive'],
+                               zip_report=config['zip'],
+                               network_threshold=config['network_threshold'], to_filter=config['filter'],
+                               progress=(lambda completed, total, _: job.report(completed, total)),
+                               checkpoint=job.checkpoint)
+        else:  # else prime others to handle
+            moss.filter_report(temp_dir, partners, False, False, config['network_threshold'], config['filter'],
+                               checkpoint=job.checkpoint)
+        return url
+
+    def _submit_finished(self, url: str, config: dict):
+        self._submission = None
         if url.startswith('Error') or not url:
             self.url_var.set('')
             self.tab_submit.stats_var.set(url)
@@ -198,25 +260,40 @@ class UciMossGui(tk.Tk):
                                  'Ensure you have a valid moss ID entered in the Settings Tab, and that you have added '
                                  'files to send.')
             return
-        else:  # Valid Report
-            self.url_var.set(url)
-            if not config['review_before_archiving']:  # Handle now...
-                if not config['download_report']:
-                    config['directory'] = self.temp_dir
-                self.moss.filter_report(path=config['directory'], partners=self.partners,
-                                        archive=config['archive'],
-                                        zip_report=config['zip'],
-                                        network_threshold=config['network_threshold'], to_filter=config['filter'])
-            else:  # else prime others to handle
-                self.tab_submit.archive_button.config(state=tk.ACTIVE)
-                if config['filter']:
-                    self.tab_submit.edit_settings.config(state=tk.ACTIVE)
-                self.moss.filter_report(self.temp_dir, self.partners, False, False, config['network_threshold'],
-                                        config['filter'])
+        # Reports of a sharded submission are listed together so they can be filtered again
+        self.url_var.set(' '.join(self.moss.shard_urls) or url)
+        self.tab_submit.last_snapshot = self.moss.snapshot
+        self.tab_submit.stats_var.set(f'Skipped {self.moss.saved_bytes} bytes of duplicate files'
+                                      if self.moss.saved_bytes else '')
+        if config['review_before_archiving']:
+            self.tab_submit.archive_button.config(state=tk.ACTIVE)
+            if config['filter']:
+                self.tab_submit.edit_settings.config(state=tk.ACTIVE)
         self.tab_submit.update_tree()
         self.tab_submit.progress_bar.stop()
+        self.tab_submit.progress_bar.config(value=0)
+
+    def _submit_failed(self, error: BaseException):
+        self._submission = None
+        if self.moss.url:
+            self.url_var.set(self.moss.url)
+        self.tab_submit.stats_var.set(f'Error: {error}')
+        self.tab_submit.progress_bar.stop()
+        self.tab_submit.progress_bar.config(value=0)
+        messagebox.showerror('Error', f'Processing the submission failed:\n\n{error}')
 
     def unlock_after_submit(self):
+        if self._waiting_for_files is not None:
+            self.after_cancel(self._waiting_for_files)
+            self._waiting_for_files = None
+            self.tab_submit.progress_bar.stop()
+            self.tab_submit.stats_var.set('Submission cancelled')
+        if self._submission is not None:
+            self._submission.cancel()
+            self._submission = None
+            self.tab_submit.progress_bar.stop()
+            self.tab_submit.progress_bar.config(value=0)
+            self.tab_submit.stats_var.set('Submission cancelled')
         self.notebook.tab(0, state=tk.NORMAL)
         self.notebook.tab(1, state=tk.NORMAL)
         self.notebook.tab(2, state=tk.NORMAL if self.tab_settings.filter_report.get() else tk.DISABLED)
@@ -235,6 +312,8 @@ class MossMenu(tk.Menu):
         settings.add_command(label='Reset Preferences', command=self.master.create_default_config)
         self.debug_mode = tk.BooleanVar(self, False)
         settings.add_command(label='Show Welcome Page on Boot', command=self._reset_welcome_page)
+        settings.add_command(label='Clear Cached Reports', command=self._clear_report_cache)
+        settings.add_command(label='Clear Past Student Corpus', command=self._clear_past_corpus)
         settings.add_separator()
         settings.add_checkbutton(label='Moss Terminal Debugger', variable=self.debug_mode)
         self.add_cascade(label='UI Settings', menu=settings)
@@ -264,6 +343,18 @@ class MossMenu(tk.Menu):
         self.master.user_config['disable_welcome'] = False
         self.master.welcome_page.disable_welcome_var.set(False)
 
+    def _clear_report_cache(self):
+        if messagebox.askokcancel(title='Clear Cached Reports',
+                                  message='Are you sure you want to delete all locally cached MOSS reports?'):
+            model.PageCache().invalidate()
+
+    def _clear_past_corpus(self):
+        if messagebox.askokcancel(title='Clear Past Student Corpus',
+                                  message='Are you sure you want to remove every source from the past student '
+                                          'corpus?'):
+            self.master.tab_files.corpus.clear()
+            self.master.tab_files.load_corpus()
+
     def _change_theme(self, theme):
         def _built_func():
             self.master.style.theme_use(theme)
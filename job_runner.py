@@ -0,0 +1,154 @@
+import queue
+import threading
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job once it has been cancelled, at the
+    next point where the job reports progress.
+    """
+
+
+class Job:
+    """
+    Handle for a unit of work queued on a JobRunner.
+    The job's function receives this handle as its first argument and
+    should call report() periodically, which both forwards progress to
+    the owner of the runner and acts as a cancellation checkpoint; long
+    loops that report nothing call checkpoint() instead.
+    """
+
+    def __init__(self, runner, function, args, kwargs, on_progress, on_done, on_error):
+        self._runner = runner
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel_event = threading.Event()
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Requests cancellation; the job stops at its next report() or
+            checkpoint() call and none of its remaining callbacks are run.
+        :return: None
+        """
+        self._cancel_event.set()
+
+    def checkpoint(self):
+        """
+        Raises JobCancelled if the job has been cancelled.
+        :return: None
+        """
+        if self.cancelled:
+            raise JobCancelled()
+
+    def report(self, *progress):
+        """
+        Queues progress information for the on_progress callback.
+        :param progress: positional values handed to on_progress
+        :return: None
+        """
+        self.checkpoint()
+        self._runner._events.put((self, 'progress', progress))
+
+    def _run(self):
+        if self.cancelled:
+            self._runner._events.put((self, 'cancelled', None))
+            return
+        try:
+            result = self._function(self, *self._args, **self._kwargs)
+        except JobCancelled:
+            self._runner._events.put((self, 'cancelled', None))
+        except BaseException as e:
+            self._runner._events.put((self, 'error', e))
+        else:
+            self._runner._events.put((self, 'done', result))
+
+
+class JobRunner:
+    """
+    Runs queued jobs on background daemon threads so that long
+    submissions and downloads do not block the Tk event loop.
+    Callbacks are never called from the worker threads: the owner calls
+    poll() from its own thread (the GUI does so through Tk's after) and
+    the callbacks of every finished or progressing job run there.
+    """
+
+    def __init__(self, workers=1):
+        """
+        :param workers: number of jobs allowed to run at the same time
+        """
+        self._jobs = queue.Queue()
+        self._events = queue.Queue()
+        self._active = set()
+        self._lock = threading.Lock()
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            job._run()
+
+    def submit(self, function, *args, on_progress=None, on_done=None, on_error=None, **kwargs) -> Job:
+        """
+        Queues function(job, *args, **kwargs) to run in the background.
+        :param function: callable receiving the Job handle followed by args and kwargs
+        :param on_progress: optional callable receiving the values passed to Job.report
+        :param on_done: optional callable receiving the job's return value
+        :param on_error: optional callable receiving the exception raised by the job
+        :return: the queued Job
+        """
+        job = Job(self, function, args, kwargs, on_progress, on_done, on_error)
+        with self._lock:
+            self._active.add(job)
+        self._jobs.put(job)
+        return job
+
+    @property
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._active)
+
+    def poll(self):
+        """
+        Runs the callbacks of every event produced since the last poll.
+            Must be called from the thread that owns the callbacks.
+        :return: None
+        """
+        while True:
+            try:
+                job, kind, value = self._events.get_nowait()
+            except queue.Empty:
+                return
+            if kind != 'progress':
+                with self._lock:
+                    self._active.discard(job)
+            if job.cancelled:
+                continue
+            if kind == 'progress' and job.on_progress is not None:
+                job.on_progress(*value)
+            elif kind == 'done' and job.on_done is not None:
+                job.on_done(value)
+            elif kind == 'error':
+                if job.on_error is None:
+                    raise value
+                job.on_error(value)
+
+    def cancel_all(self):
+        """
+        Cancels every queued or running job.
+        :return: None
+        """
+        with self._lock:
+            for job in self._active:
+                job.cancel()
+            self._active.clear()
@@ -1,14 +1,36 @@
+import os
 import re
+import csv
+import sys
+import json
+import time
+import struct
+import queue
+import socket
+import hashlib
+import zipfile
 import datetime
 import pathlib
+import threading
+import http.client
+from array import array
+import codecs
+from urllib.parse import urlsplit
 from urllib.request import urlopen
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from shutil import make_archive, rmtree
 
 import mosspy
 import jinja2
 
 BASE_URL = 'http://moss.stanford.edu/results/'
+CACHE_DIR = pathlib.Path(__file__).resolve().parent.joinpath('cache')
+TEMPLATE_DIR = pathlib.Path(__file__).resolve().parent.joinpath('templates')
+CORPUS_FILE = pathlib.Path(__file__).resolve().parent.joinpath('past_corpus.json')
+BASE, CURRENT, PAST = FILE_GROUPS = ('base', 'current', 'past')
+EXPORT_FORMATS = ('jsonl', 'csv', 'snapshot')
 
 
 def lock_after_send(f):
@@ -37,6 +59,1462 @@ def lock_after_send(f):
     return _func
 
 
+class TemplateBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """
+    Stores compiled templates under the cache directory, recreating it
+    if the cache was cleared. Failing to write is not an error: the
+    template is simply compiled again next time.
+    """
+
+    def dump_bytecode(self, bucket):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
+
+
+@lru_cache(maxsize=None)
+def template_environment() -> jinja2.Environment:
+    """
+    :return: the Jinja environment shared by every report, loading templates from
+             TEMPLATE_DIR and keeping their compiled bytecode in the cache directory
+    """
+    return jinja2.Environment(loader=jinja2.FileSystemLoader(str(TEMPLATE_DIR)),
+                              bytecode_cache=TemplateBytecodeCache(str(CACHE_DIR.joinpath('templates'))))
+
+
+class DisjointSet:
+    """
+    Union-find structure over hashable nodes used to group matched
+    students into networks in a single pass over the matches.
+    Uses union by size and path halving, so each operation runs in
+    near-constant amortized time.
+    """
+
+    def __init__(self, pairs=()):
+        """
+        :param pairs: iterable of two-tuples of nodes to union on construction
+        """
+        self._parent = {}
+        self._size = {}
+        for first, second in pairs:
+            self.union(first, second)
+
+    def __contains__(self, node) -> bool:
+        return node in self._parent
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    def add(self, node):
+        """
+        Registers a node as its own component if it is not yet known.
+        :param node: hashable node
+        :return: None
+        """
+        if node not in self._parent:
+            self._parent[node] = node
+            self._size[node] = 1
+
+    def find(self, node):
+        """
+        Returns the representative node of the component holding node.
+        :param node: hashable node previously added to the structure
+        :return: representative node
+        """
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, first, second):
+        """
+        Merges the components holding first and second, adding either
+            node if it is not yet known.
+        :param first: hashable node
+        :param second: hashable node
+        :return: representative node of the merged component
+        """
+        self.add(first)
+        self.add(second)
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return first
+        if self._size[first] < self._size[second]:
+            first, second = second, first
+        self._parent[second] = first
+        self._size[first] += self._size.pop(second)
+        return first
+
+    def components(self) -> ({str: int}, [frozenset]):
+        """
+        Groups every known node by component.
+        :return: a tuple of (index, networks) where networks is a list of
+                 frozensets of nodes and index maps each node to the position
+                 of its network within networks
+        """
+        groups = defaultdict(list)
+        for node in self._parent:
+            groups[self.find(node)].append(node)
+        networks = [frozenset(members) for members in groups.values()]
+        index = {node: position for position, network in enumerate(networks) for node in network}
+        return index, networks
+
+
+class PageCache:
+    """
+    Size-bounded on-disk cache of fetched MOSS result pages.
+    Pages are stored under a directory per result, named after the
+    hash of the result url, so a single report can be invalidated
+    without touching the others. Reads refresh a page's modification
+    time, and once the cache grows past max_bytes the least recently
+    used pages are evicted until it is back under low_water of max_bytes,
+    so a full cache is not rescanned on every later write.
+    The usage of each cache directory is kept at class level, so every
+    instance using the same directory (the GUI creates several) sees the
+    pages written or invalidated by the others.
+    """
+    _match_page = re.compile(r'match\d+(-\w+)?\.html')
+    # Bytes cached in each directory, counted from disk on first use
+    _usage = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=512 * 2 ** 20, low_water=0.9):
+        """
+        :param directory: directory to store cached pages in (created on first write)
+        :param max_bytes: upper bound on the combined size of all cached pages
+        :param low_water: fraction of max_bytes the cache is brought down to when it is over max_bytes
+        """
+        self.directory = pathlib.Path(directory).resolve()
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+
+    def _locate(self, url: str) -> pathlib.Path:
+        result_url, _, page = url.rstrip('/').rpartition('/')
+        if not self._match_page.fullmatch(page):
+            result_url, page = url.rstrip('/'), 'index.html'
+        return self.directory.joinpath(hashlib.sha256(result_url.encode()).hexdigest()[:32], page)
+
+    def _entries(self) -> [(float, int, pathlib.Path)]:
+        if not self.directory.is_dir():
+            return []
+        return [(stat.st_mtime, stat.st_size, page) for page in self.directory.glob('*/*.html')
+                for stat in (page.stat(),)]
+
+    def get(self, url: str):
+        """
+        :param url: url of the cached page
+        :return: the cached page as bytes, or None if it is not cached
+        """
+        page = self._locate(url)
+        try:
+            contents = page.read_bytes()
+            os.utime(page)
+        except OSError:
+            return None
+        return contents
+
+    def open(self, url: str):
+        """
+        :param url: url of the cached page
+        :return: binary file object reading the cached page, or None if it is not cached
+        """
+        page = self._locate(url)
+        try:
+            cached = page.open('rb')
+            os.utime(page)
+        except OSError:
+            return None
+        return cached
+
+    def stage(self, url: str) -> pathlib.Path:
+        """
+        :param url: url of the page about to be written
+        :return: temporary path to write the page to before handing it to commit
+        """
+        page = self._locate(url)
+        page.parent.mkdir(parents=True, exist_ok=True)
+        return page.with_name(f'{page.name}.{threading.get_ident()}.tmp')
+
+    def commit(self, url: str, staged: pathlib.Path):
+        """
+        Moves a page written to a path from stage into the cache, evicting
+            the least recently used pages if the cache is over its size limit.
+        :param url: url of the page
+        :param staged: path returned by stage(url)
+        :return: None
+        """
+        page = self._locate(url)
+        with self._lock:
+            usage = self._usage.get(self.directory)
+            if usage is None:
+                usage = sum(size for _, size, _ in self._entries())
+            previous = page.stat().st_size if page.exists() else 0
+            size = staged.stat().st_size
+            staged.replace(page)
+            self._usage[self.directory] = usage + size - previous
+            if self._usage[self.directory] > self.max_bytes:
+                self._evict()
+
+    def put(self, url: str, contents: bytes):
+        """
+        Stores contents as the page for url, evicting the least recently
+            used pages if the cache is over its size limit.
+        :param url: url of the page
+        :param contents: page body as bytes
+        :return: None
+        """
+        staged = self.stage(url)
+        staged.write_bytes(contents)
+        self.commit(url, staged)
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=(lambda entry: entry[0]))
+        # Recount from disk, as another process (such as moss_cli --clear-cache) may have changed the cache
+        usage = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for _, size, page in entries:
+            if usage <= target:
+                break
+            try:
+                page.unlink()
+            except OSError:
+                continue
+            usage -= size
+        self._usage[self.directory] = usage
+
+    def invalidate(self, url: str = None):
+        """
+        Removes the cached pages of the report at url, or every cached
+            page if no url is given.
+        :param url: result url (or any page url within the result)
+        :return: None
+        """
+        with self._lock:
+            target = self._locate(url).parent if url else self.directory
+            if target.exists():
+                rmtree(target)
+            self._usage.pop(self.directory, None)
+
+
+class ResourceDownloader:
+    """
+    Downloads report resources over a bounded pool of worker threads.
+    Each worker keeps its own keep-alive connection per host, requests
+    are spaced out by a shared politeness interval so the MOSS server
+    does not mark the archive process as spam, and failed requests are
+    retried with exponential backoff.
+    """
+
+    def __init__(self, workers=4, request_interval=0.1, retries=3, backoff=0.5, timeout=30, cache=None):
+        """
+        :param workers: number of concurrent connections to use
+        :param request_interval: minimum number of seconds between the start of any two requests
+        :param retries: number of additional attempts made for a failing request
+        :param backoff: seconds to wait before the first retry, doubled on each following retry
+        :param timeout: socket timeout, in seconds, for each connection
+        :param cache: optional PageCache consulted before, and filled after, each request
+        """
+        self.workers = max(1, workers)
+        self.request_interval = request_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self._local = threading.local()
+        self._rate_lock = threading.Lock()
+        self._next_request = 0.0
+
+    def _wait_turn(self):
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.request_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        connections = self._local.__dict__.setdefault('connections', {})
+        if (scheme, netloc) not in connections:
+            connection_type = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connections[(scheme, netloc)] = connection_type(netloc, timeout=self.timeout)
+        return connections[(scheme, netloc)]
+
+    def _drop_connection(self, scheme: str, netloc: str):
+        connection = self._local.__dict__.get('connections', {}).pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Retrieves the body of url, reusing this thread's connection to
+            the host when possible.
+        :param url: http(s) url to download
+        :return: response body as bytes
+        """
+        if self.cache is not None:
+            cached = self.cache.get(url)
+            if cached is not None:
+                return cached
+        parts = urlsplit(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        for attempt in range(self.retries + 1):
+            self._wait_turn()
+            try:
+                connection = self._connection(parts.scheme, parts.netloc)
+                connection.request('GET', target or '/', headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read()
+                if response.will_close:
+                    self._drop_connection(parts.scheme, parts.netloc)
+                if response.status >= 500:
+                    raise ConnectionError(f'{url} responded with status {response.status}')
+                if response.status >= 400:
+                    raise ValueError(f'{url} responded with status {response.status}')
+                if self.cache is not None:
+                    self.cache.put(url, body)
+                return body
+            except (OSError, http.client.HTTPException) as e:
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt == self.retries:
+                    raise ConnectionError(f'Failed to download {url}: {e}') from e
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _save(self, url: str, destination: pathlib.Path, transform):
+        contents = self.fetch(url).decode()
+        if transform is not None:
+            contents = transform(contents)
+        with destination.open('w') as f:
+            f.write(contents)
+        return destination
+
+    def download(self, jobs: [(str, pathlib.Path, None)], progress=None):
+        """
+        Downloads every job concurrently, stopping at the first failure.
+        :param jobs: iterable of (url, destination, transform) where transform is
+                     None or a callable applied to the decoded page before saving
+        :param progress: optional callable receiving (completed, total, destination)
+                         after each file is written
+        :return: None
+        """
+        jobs = list(jobs)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._save, *job) for job in jobs]
+            try:
+                for completed, future in enumerate(as_completed(futures), 1):
+                    destination = future.result()
+                    if progress is not None:
+                        progress(completed, len(jobs), destination)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+
+class ZipMember:
+    """
+    A submission file stored inside a zip archive.
+    Can be added to a MossUCI instance in place of a file path; the
+    member is streamed straight out of the archive when the submission
+    is sent, so it never has to be extracted to disk.
+    """
+    __slots__ = ('archive', 'member', 'size')
+
+    def __init__(self, archive: str, member: str, size: int = None):
+        """
+        :param archive: path to the zip file
+        :param member: name of the member within the zip file
+        :param size: uncompressed size of the member (read from the archive if not given)
+        """
+        self.archive = str(archive)
+        self.member = member
+        if size is None:
+            with zipfile.ZipFile(self.archive) as archive_file:
+                size = archive_file.getinfo(member).file_size
+        self.size = int(size)
+
+    def __str__(self) -> str:
+        return f'{self.archive}/{self.member}'
+
+    def __repr__(self) -> str:
+        return f'ZipMember({self.archive!r}, {self.member!r}, {self.size!r})'
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ZipMember) and (self.archive, self.member) == (other.archive, other.member)
+
+    def __hash__(self) -> int:
+        return hash((self.archive, self.member))
+
+    def open(self):
+        """
+        :return: binary file object reading the uncompressed member
+        """
+        with zipfile.ZipFile(self.archive) as archive_file:
+            # The member keeps the archive's file handle open until it is closed itself
+            return archive_file.open(self.member)
+
+
+class FileRecord:
+    """
+    A file waiting to be submitted: its source (file path or ZipMember),
+    the display name to submit it under, its group (BASE, CURRENT or PAST)
+    and, when they were stored with the file, its StoredDigests.
+    """
+    __slots__ = ('path', 'display_name', 'group', 'digests')
+
+    def __init__(self, path, display_name: str, group: str, digests=None):
+        assert group in FILE_GROUPS, group
+        self.path = path
+        self.display_name = display_name
+        self.group = group
+        self.digests = digests
+
+    def __repr__(self) -> str:
+        return f'FileRecord({self.path!r}, {self.display_name!r}, {self.group!r})'
+
+
+def source_size(source) -> int:
+    """
+    :param source: file path or ZipMember
+    :return: size in bytes of the file's contents
+    """
+    return source.size if isinstance(source, ZipMember) else os.path.getsize(source)
+
+
+def open_source(source):
+    """
+    :param source: file path or ZipMember
+    :return: binary file object reading the file's contents
+    """
+    return source.open() if isinstance(source, ZipMember) else open(source, 'rb')
+
+
+def submitted_name(file_path, display_name: str) -> str:
+    """
+    :param file_path: file path or ZipMember
+    :param display_name: display name given when the file was added, or None
+    :return: name the file is submitted under (display names cannot contain spaces or \\, as in mosspy)
+    """
+    if display_name is None:
+        return str(file_path).replace(" ", "_").replace("\\", "/")
+    return display_name
+
+
+def fingerprint(source, normalise_whitespace=True) -> (str, int, int):
+    """
+    :param source: file path or ZipMember
+    :param normalise_whitespace: collapse runs of whitespace before hashing, so that files
+                                 only differing in indentation or line endings share a digest
+    :return: tuple of (sha256 hex digest, size in bytes, number of lines)
+    """
+    with open_source(source) as file:
+        data = file.read()
+    return _digest(data, normalise_whitespace), len(data), _count_lines(data)
+
+
+def _count_lines(data: bytes) -> int:
+    return data.count(b'\n') + (0 if not data or data.endswith(b'\n') else 1)
+
+
+def _digest(data: bytes, normalise_whitespace: bool) -> str:
+    return hashlib.sha256(b' '.join(data.split()) if normalise_whitespace else data).hexdigest()
+
+
+class StoredDigests(namedtuple('StoredDigests', ('sha256', 'normalised_sha256', 'lines'))):
+    """
+    Hashes of a file kept alongside it (such as in the past student
+        corpus), so find_duplicates does not need to read it again: its
+        sha256 digest as is and with whitespace normalised, and its number of lines.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def of(cls, source) -> 'StoredDigests':
+        """
+        :param source: file path or ZipMember
+        :return: StoredDigests of the file's current contents
+        """
+        with open_source(source) as file:
+            data = file.read()
+        return cls(_digest(data, False), _digest(data, True), _count_lines(data))
+
+    def fingerprint(self, size: int, normalise_whitespace=True) -> (str, int, int):
+        """
+        :param size: size in bytes of the file
+        :param normalise_whitespace: as given to fingerprint
+        :return: the tuple fingerprint would return for the file
+        """
+        return self.normalised_sha256 if normalise_whitespace else self.sha256, size, self.lines
+
+
+def source_key(file_path):
+    """
+    :param file_path: file path or ZipMember
+    :return: hashable key identifying the file, equal for every path to the same file
+    """
+    return file_path if isinstance(file_path, ZipMember) else os.path.abspath(file_path)
+
+
+class DuplicateGroup(namedtuple('DuplicateGroup', ('name', 'lines', 'copies', 'uploaded'))):
+    """
+    Submissions identical to a kept submission (see find_duplicates): the
+        submitted name and number of lines of the kept file, the submitted
+        names of the copies that were dropped and of the copies that were
+        uploaded anyway so that MOSS's ignore limit still counts them.
+    """
+    __slots__ = ()
+
+
+def find_duplicates(base_files: [(str, str)], files: [(str, str)], normalise_whitespace=True,
+                    directory_mode=False, workers=None, ignore_limit=10,
+                    digests=None) -> ([(str, str)], [(str, str)], {str: DuplicateGroup}, int):
+    """
+    Hashes every file of a submission to find the ones that only need
+        to be uploaded once:
+        - files added more than once (the same path or zip member),
+        - base files identical to an earlier base file,
+        - submissions identical to a base file (MOSS ignores all of their contents anyway),
+        - submissions identical to more than ignore_limit others. MOSS ignores passages found in
+          more than ignore_limit files, so every passage of these is ignored as long as
+          ignore_limit + 1 of the copies are uploaded: the rest are dropped and mapped to a kept
+          copy, so the report can be expanded back with expand_duplicates. Smaller sets of
+          identical submissions are all uploaded, as dropping any of them could bring a passage
+          they share with other files back under the limit.
+        Only submissions whose submitted name belongs to no other file are
+        dropped this way, as the report could not tell their matches apart;
+        the last case is skipped entirely in directory mode, where MOSS
+        compares whole directories and dropping a single file would change the matches.
+    :param base_files: list of (file_path or ZipMember, display_name) sent as base files
+    :param files: list of (file_path or ZipMember, display_name) sent as submissions
+    :param normalise_whitespace: also treat files only differing in whitespace as identical
+    :param directory_mode: whether the submission is sent in directory mode
+    :param workers: number of threads hashing files (defaults to ThreadPoolExecutor's default)
+    :param ignore_limit: MOSS's ignore limit (the -m option) the submission is sent with
+    :param digests: optional dict mapping the source_key of files to their StoredDigests,
+                    which are used instead of reading those files
+    :return: tuple of (base_files, files, duplicates, saved_bytes) where base_files and files
+             are what is left to upload and duplicates maps the source_key of each kept
+             submission to the DuplicateGroup of its identical copies
+    """
+    saved = 0
+    seen_sources = set()
+    unique_base, unique_files = [], []
+    for group, unique in ((base_files, unique_base), (files, unique_files)):
+        for file_path, display_name in group:
+            key = source_key(file_path)
+            if key in seen_sources:
+                saved += source_size(file_path)
+            else:
+                seen_sources.add(key)
+                unique.append((file_path, display_name))
+
+    stored = digests or {}
+
+    def _fingerprint(file_path):
+        known = stored.get(source_key(file_path))
+        if known is None:
+            return fingerprint(file_path, normalise_whitespace)
+        return known.fingerprint(source_size(file_path), normalise_whitespace)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fingerprints = list(executor.map(lambda file: _fingerprint(file[0]), unique_base + unique_files))
+    base_digests, file_digests = fingerprints[:len(unique_base)], fingerprints[len(unique_base):]
+
+    kept_base = []
+    seen_base = set()
+    for file, (digest, size, _) in zip(unique_base, base_digests):
+        if digest in seen_base:
+            saved += size
+        else:
+            seen_base.add(digest)
+            kept_base.append(file)
+
+    names = defaultdict(int)
+    identical = defaultdict(list)
+    for position, ((file_path, display_name), (digest, size, _)) in enumerate(zip(unique_files, file_digests)):
+        names[submitted_name(file_path, display_name)] += 1
+        if digest in seen_base:
+            saved += size
+        else:
+            identical[digest].append(position)
+
+    dropped = set()
+    duplicates = {}
+    for positions in identical.values():
+        if directory_mode or len(positions) <= ignore_limit + 1:
+            continue
+        aliased = [position for position in positions
+                   if names[submitted_name(*unique_files[position])] == 1]
+        # The kept copy and enough others to reach ignore_limit + 1 uploads, counting those with shared names
+        uploads = max(1, ignore_limit + 1 - (len(positions) - len(aliased)))
+        copies = aliased[uploads:]
+        if not copies:
+            continue
+        kept, uploaded = aliased[0], aliased[1:uploads]
+        dropped.update(copies)
+        saved += sum(file_digests[position][1] for position in copies)
+        duplicates[source_key(unique_files[kept][0])] = DuplicateGroup(
+            submitted_name(*unique_files[kept]), file_digests[kept][2],
+            [submitted_name(*unique_files[position]) for position in copies],
+            [submitted_name(*unique_files[position]) for position in uploaded])
+    kept_files = [file for position, (file, (digest, _, _)) in enumerate(zip(unique_files, file_digests))
+                  if digest not in seen_base and position not in dropped]
+    return kept_base, kept_files, duplicates, saved
+
+
+def expand_duplicates(matches, duplicates: {str: DuplicateGroup}) -> ['MatchRecord']:
+    """
+    Adds back the submissions dropped by find_duplicates to scraped matches:
+        every dropped copy inherits the matches of the copy that was
+        uploaded, and every other file of a set of identical copies is
+        matched with the kept copy at 100% without a MOSS match page (an
+        empty url and match number), so that the set stays in one network.
+    :param matches: scraped MatchRecords (or a MatchTable)
+    :param duplicates: duplicates as returned by find_duplicates
+    :return: list of MatchRecords
+    """
+    # Scraped names are lower case
+    copies = {group.name.lower(): [copy.lower() for copy in group.copies] for group in duplicates.values()}
+    expanded = []
+    for url, match_num, student1, perc1, student2, perc2, lines in matches:
+        expanded.append(MatchRecord(url, match_num, student1, perc1, student2, perc2, lines))
+        expanded.extend(MatchRecord(url, match_num, copy, perc1, student2, perc2, lines)
+                        for copy in copies.get(student1, ()))
+        expanded.extend(MatchRecord(url, match_num, student1, perc1, copy, perc2, lines)
+                        for copy in copies.get(student2, ()))
+    for group in duplicates.values():
+        expanded.extend(MatchRecord('', '', group.name.lower(), 100, copy.lower(), 100, group.lines)
+                        for copy in group.uploaded + group.copies)
+    return expanded
+
+
+def partition_files(files: [(str, str)], shards: int) -> [[(str, str)]]:
+    """
+    Splits files into at most shards partitions of similar size, keeping
+        the files of a student (the first component of their submitted
+        name) in the same partition.
+    :param files: list of (file_path or ZipMember, display_name)
+    :param shards: number of partitions wanted
+    :return: non-empty partitions, each keeping the original order of its files
+    """
+    students = defaultdict(list)
+    for position, (file_path, display_name) in enumerate(files):
+        students[submitted_name(file_path, display_name).split('/')[0]].append(position)
+    sizes = {student: sum(source_size(files[position][0]) for position in positions)
+             for student, positions in students.items()}
+    partitions = [(0, shard, []) for shard in range(max(1, shards))]
+    # Largest students first, each to the currently smallest partition
+    for student in sorted(students, key=(lambda name: -sizes[name])):
+        size, shard, positions = min(partitions)
+        positions.extend(students[student])
+        partitions[shard] = (size + sizes[student], shard, positions)
+    return [[files[position] for position in sorted(positions)] for _, _, positions in partitions if positions]
+
+
+def merge_shards(tables: ['MatchTable'], current_students) -> 'MatchTable':
+    """
+    Merges the reports of a sharded submission (see MossUCI.send) into one.
+        Every shard compares the current students with each other, so those
+        matches are only kept from the first shard; all of its other rows and
+        every row of the later shards involving a past student are kept, as
+        are several matches between the same two names (files sharing a
+        display name are reported separately).
+    :param tables: MatchTable of every shard, the first shard first
+    :param current_students: display names of the current students (as added to MossUCI)
+    :return: MatchTable of the merged matches, by decreasing lines matched
+    """
+    # Scraped names are lower case, and name the student's directory in directory mode
+    current = {name.lower() for name in current_students}
+    current |= {f"{name.split('/')[0]}/" for name in current}
+    matches = list(tables[0])
+    for table in tables[1:]:
+        matches.extend(match for match in table if match.student1 not in current or match.student2 not in current)
+    matches.sort(key=(lambda match: -match.lines))
+    return MatchTable(matches)
+
+
+class SubmissionUploader:
+    """
+    Streams a submission to a MOSS server using the same
+    moss/file/query protocol as mosspy.Moss.send.
+    Files are read in fixed-size chunks on a background thread that
+    stays up to read_ahead chunks ahead of the socket, so the next files
+    are already read and their headers encoded while the current one is
+    on the wire, without ever holding a whole file in memory.
+    """
+    _done = object()
+
+    def __init__(self, server=mosspy.Moss.server, port=mosspy.Moss.port, chunk_size=64 * 1024, read_ahead=16,
+                 timeout=None):
+        """
+        :param server: host name of the MOSS server
+        :param port: port of the MOSS server
+        :param chunk_size: number of bytes read from a file and sent at a time
+        :param read_ahead: maximum number of chunks buffered ahead of the socket
+        :param timeout: socket timeout in seconds, or None to block indefinitely
+        """
+        self.server = server
+        self.port = port
+        self.chunk_size = chunk_size
+        self.read_ahead = read_ahead
+        self.timeout = timeout
+
+    @staticmethod
+    def _header(file_id: int, language: str, size: int, file_path: str, display_name: str) -> bytes:
+        return f"file {file_id} {language} {size} {submitted_name(file_path, display_name)}\n".encode()
+
+    def _produce(self, uploads: [(int, str, str)], language: str, chunks: queue.Queue, stop: threading.Event):
+        try:
+            for file_id, file_path, display_name in uploads:
+                with open_source(file_path) as f:
+                    remaining = source_size(file_path)
+                    chunks.put((self._header(file_id, language, remaining, str(file_path), display_name), 0))
+                    while remaining > 0 and not stop.is_set():
+                        chunk = f.read(min(self.chunk_size, remaining))
+                        if not chunk:
+                            raise OSError(f'{file_path} was truncated while uploading')
+                        remaining -= len(chunk)
+                        chunks.put((chunk, len(chunk)))
+                if stop.is_set():
+                    return
+            chunks.put((self._done, 0))
+        except BaseException as e:
+            chunks.put((e, 0))
+
+    @staticmethod
+    def _read_line(connection: socket.socket) -> str:
+        received = b''
+        while not received.endswith(b'\n'):
+            data = connection.recv(1024)
+            if not data:
+                break
+            received += data
+        return received.decode()
+
+    def upload(self, user_id, options: dict, base_files: [(str, str)], files: [(str, str)], progress=None) -> str:
+        """
+        Sends the submission and waits for the server's reply.
+        :param user_id: MOSS account number
+        :param options: option dictionary as kept by mosspy.Moss
+        :param base_files: list of (file_path or ZipMember, display_name) sent as base files
+        :param files: list of (file_path or ZipMember, display_name) sent as submissions
+        :param progress: optional callable receiving (bytes_sent, total_bytes, display_name)
+                         after each chunk is written to the socket
+        :return: reply from the server (the report url on success) without newlines
+        """
+        uploads = [(0, file_path, display_name) for file_path, display_name in base_files]
+        uploads += [(file_id, file_path, display_name)
+                    for file_id, (file_path, display_name) in enumerate(files, 1)]
+        total = sum(source_size(file_path) for _, file_path, _ in uploads)
+        sent = 0
+
+        connection = socket.create_connection((self.server, self.port), timeout=self.timeout)
+        chunks = queue.Queue(maxsize=max(1, self.read_ahead))
+        stop = threading.Event()
+        producer = None
+        try:
+            connection.sendall(f"moss {user_id}\n"
+                               f"directory {options['d']}\n"
+                               f"X {options['x']}\n"
+                               f"maxmatches {options['m']}\n"
+                               f"show {options['n']}\n"
+                               f"language {options['l']}\n".encode())
+            if self._read_line(connection).strip() == 'no':
+                connection.sendall(b"end\n")
+                raise ValueError("send() => Language not accepted by server")
+
+            producer = threading.Thread(target=self._produce, args=(uploads, options['l'], chunks, stop),
+                                        daemon=True)
+            producer.start()
+            display_names = iter(display_name or str(file_path) for _, file_path, display_name in uploads)
+            current = None
+            while True:
+                chunk, size = chunks.get()
+                if chunk is self._done:
+                    break
+                if isinstance(chunk, BaseException):
+                    raise chunk
+                connection.sendall(chunk)
+                if not size:
+                    current = next(display_names)
+                    continue
+                sent += size
+                if progress is not None:
+                    progress(sent, total, current)
+
+            connection.sendall(f"query 0 {options['c']}\n".encode())
+            response = self._read_line(connection)
+            connection.sendall(b"end\n")
+        finally:
+            stop.set()
+            if producer is not None:
+                # Unblock the producer if it is waiting on a full queue
+                while producer.is_alive():
+                    try:
+                        chunks.get(timeout=0.05)
+                    except queue.Empty:
+                        pass
+            connection.close()
+        return response.replace("\n", "")
+
+
+class MatchRecord(namedtuple('MatchRecord', ('url', 'match_num', 'student1', 'perc1', 'student2', 'perc2', 'lines'))):
+    """
+    A row of a MOSS results index: the match page url and number, both
+        students (lower case) with the percentage of their file matched,
+        and the number of lines matched.
+    Matches added back for identical files (see expand_duplicates) have
+        an empty url and match number.
+    """
+    __slots__ = ()
+
+
+class ResultsParser:
+    """
+    Incremental parser of a MOSS results index page.
+    Bytes are fed in chunks as they are read from the response (or the
+    cache) and the rows completed by each chunk are returned straight
+    away, so only the unfinished end of the page is ever buffered.
+    The date, options and error section of the page are kept in
+    date_info, option_info and error_info.
+    """
+    _row = re.compile(
+        r'<tr><td><a href=\"(?P<url>http://moss\.stanford\.edu/results/\d+/\d+/match(?P<match_num>\d+)\.html)\">'
+        r'(?P<student1>.+) \((?P<perc1>\d{1,2})%\)</a>\s*<td><a href=\"http://moss\.stanford\.edu/results/\d+/\d+/match'
+        r'\d+\.html\">(?P<student2>.+) \((?P<perc2>\d{1,2})%\)</a>\s*<td align=right>(?P<lines>\d+)', re.IGNORECASE)
+    _date = re.compile(r'Moss Results<p>\s(?P<date>.+)\s<p>\sOptions')
+    _options = re.compile(r'<p>\sOptions (?P<options>.+)\s<HR>')
+    _errors = 'any errors encountered during this query are listed below.<p>'
+
+    def __init__(self):
+        self.date_info = None
+        self.option_info = None
+        self.error_info = ''
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._in_errors = False
+
+    def feed(self, data: bytes) -> [MatchRecord]:
+        """
+        :param data: next chunk of the page
+        :return: the rows completed by this chunk
+        """
+        return self._scan(self._decoder.decode(data), False)
+
+    def close(self) -> [MatchRecord]:
+        """
+        Parses whatever is left of the page.
+        :return: the remaining rows
+        """
+        records = self._scan(self._decoder.decode(b'', True), True)
+        if self.date_info is None or self.option_info is None:
+            raise ValueError('Not a MOSS results page: no date or options found')
+        self.error_info = re.split('</body>', self.error_info, maxsplit=1, flags=re.IGNORECASE)[0].strip()
+        return records
+
+    def _scan(self, text: str, final: bool) -> [MatchRecord]:
+        if self._in_errors:
+            self.error_info += text
+            return []
+        buffer = self._buffer + text
+        if self.date_info is None:
+            date = self._date.search(buffer)
+            self.date_info = date.group('date') if date else None
+        if self.option_info is None:
+            options = self._options.search(buffer)
+            self.option_info = options.group('options') if options else None
+
+        records = []
+        position = 0
+        for row in self._row.finditer(buffer):
+            if row.end() == len(buffer) and not final:
+                # The number of lines may continue in the next chunk
+                break
+            records.append(MatchRecord(row.group('url').lower(), row.group('match_num'),
+                                       row.group('student1').lower(), int(row.group('perc1')),
+                                       row.group('student2').lower(), int(row.group('perc2')),
+                                       int(row.group('lines'))))
+            position = row.end()
+
+        rest = buffer[position:]
+        errors = rest.lower().find(self._errors)
+        if errors != -1:
+            self._in_errors = True
+            self.error_info = rest[errors + len(self._errors):]
+            self._buffer = ''
+        elif self.date_info is None or self.option_info is None:
+            # Keep everything until the header has been read
+            self._buffer = rest
+        else:
+            # Only keep the unfinished row (or a possibly split error section heading)
+            start = rest.lower().rfind('<tr')
+            self._buffer = rest[start if start != -1 else max(0, len(rest) - len(self._errors)):]
+        return records
+
+
+class MatchTable:
+    """
+    Columnar store of the matches of a report.
+    Each column is an array of integers, with student names interned in
+        names (their position being the student's id) and result urls
+        interned in results, so a row costs a few dozen bytes instead of
+        a tuple of seven strings.
+    A match number of -1 marks a match without a MOSS match page (see
+        expand_duplicates).
+    """
+    COLUMNS = ('result', 'match_num', 'student1', 'student2', 'perc1', 'perc2', 'lines')
+
+    def __init__(self, records=()):
+        """
+        :param records: MatchRecords to load into the table
+        """
+        self.names = []
+        self.ids = dict()
+        self.results = []
+        self._result_ids = dict()
+        # Fixed size typecodes, so a snapshot (see ReportSnapshot) reads the same on every platform
+        self.result = array('i')
+        self.match_num = array('i')
+        self.student1 = array('i')
+        self.student2 = array('i')
+        self.perc1 = array('B')
+        self.perc2 = array('B')
+        self.lines = array('i')
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def __iter__(self):
+        return (self.record(position) for position in range(len(self)))
+
+    def intern(self, name: str) -> int:
+        """
+        :param name: student name
+        :return: the student's id, added to the table if needed
+        """
+        student = self.ids.get(name)
+        if student is None:
+            student = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return student
+
+    def extend(self, records: [MatchRecord]):
+        for record in records:
+            result_url = record.url.rpartition('/')[0]
+            result = self._result_ids.get(result_url)
+            if result is None:
+                result = self._result_ids[result_url] = len(self.results)
+                self.results.append(result_url)
+            self.result.append(result)
+            self.match_num.append(int(record.match_num) if record.match_num else -1)
+            self.student1.append(self.intern(record.student1))
+            self.student2.append(self.intern(record.student2))
+            self.perc1.append(record.perc1)
+            self.perc2.append(record.perc2)
+            self.lines.append(record.lines)
+
+    def record(self, position: int) -> MatchRecord:
+        """
+        :param position: row of the match
+        :return: the match as a MatchRecord
+        """
+        match_num = self.match_num[position]
+        return MatchRecord(f'{self.results[self.result[position]]}/match{match_num}.html' if match_num >= 0 else '',
+                           str(match_num) if match_num >= 0 else '',
+                           self.names[self.student1[position]], self.perc1[position],
+                           self.names[self.student2[position]], self.perc2[position], self.lines[position])
+
+    def result_id(self, position: int) -> str:
+        """
+        :param position: row of the match
+        :return: id of the result (the last part of its url) the match belongs to
+        """
+        return self.results[self.result[position]].rpartition('/')[2]
+
+    def pairs(self):
+        """
+        :return: iterable of the (student1, student2) ids of every match
+        """
+        return zip(self.student1, self.student2)
+
+
+class PartnerIndex:
+    """
+    Set of partnered pairs of students, with names interned to ids and
+        each pair stored as a single integer key, so checking a pair (or
+        whether a network is just a pair of partners) is one hash lookup.
+    Iterating gives each pair as a frozenset, like the sets partner
+        scripts return.
+    """
+
+    def __init__(self, pairs=()):
+        """
+        :param pairs: iterable of pairs of names (frozensets, tuples or lists)
+        """
+        self.names = []
+        self.ids = dict()
+        self._keys = set()
+        self._directory_index = None
+        self.update(pairs)
+
+    @classmethod
+    def of(cls, partners) -> 'PartnerIndex':
+        """
+        :param partners: PartnerIndex, or iterable of pairs of names
+        :return: partners as a PartnerIndex (itself if it already is one)
+        """
+        return partners if isinstance(partners, cls) else cls(partners)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self):
+        names = self.names
+        return (frozenset((names[key >> 32], names[key & 0xFFFFFFFF])) for key in self._keys)
+
+    def __contains__(self, pair) -> bool:
+        """
+        :param pair: collection of names; only a pair of partners (or a student partnered with themself) is found
+        """
+        if len(pair) > 2:
+            return False
+        pair = tuple(pair)
+        if len(pair) == 2:
+            return self.partnered(*pair)
+        return len(pair) == 1 and self.partnered(pair[0], pair[0])
+
+    def _key(self, first: int, second: int) -> int:
+        return (first << 32) | second if first <= second else (second << 32) | first
+
+    def add(self, first: str, second: str):
+        keys = []
+        for name in (first, second):
+            student = self.ids.get(name)
+            if student is None:
+                student = self.ids[name] = len(self.names)
+                self.names.append(name)
+            keys.append(student)
+        self._keys.add(self._key(*keys))
+        self._directory_index = None
+
+    def update(self, pairs):
+        for pair in pairs:
+            pair = tuple(pair)
+            self.add(pair[0], pair[-1])
+
+    def partnered(self, first: str, second: str) -> bool:
+        """
+        :return: whether the two students are partners
+        """
+        ids = self.ids
+        return first in ids and second in ids and self._key(ids[first], ids[second]) in self._keys
+
+    def directory_mode(self) -> 'PartnerIndex':
+        """
+        :return: the same partners named by directory (student/), as in reports submitted in directory mode
+        """
+        if self._directory_index is None:
+            names = [f"{name.rstrip('/')}/" for name in self.names]
+            self._directory_index = PartnerIndex((names[key >> 32], names[key & 0xFFFFFFFF]) for key in self._keys)
+        return self._directory_index
+
+
+class MatchGraph:
+    """
+    The networks of a MatchTable (its connected components), built once
+    so the report can be filtered again by threshold, partners or current
+    students without rebuilding them.
+    Each network's matches are kept sorted by decreasing lines matched,
+    and the matches each threshold keeps are remembered, so changing the
+    partners or current students only re-selects networks.
+    """
+
+    def __init__(self, table: MatchTable):
+        """
+        :param table: MatchTable holding the matches
+        """
+        self.table = table
+        index, self.id_networks = DisjointSet(table.pairs()).components()
+        self.networks = [frozenset(table.names[student] for student in network) for network in self.id_networks]
+        self.network_index = {table.names[student]: network for student, network in index.items()}
+        lines = table.lines
+        network_positions = [array('l') for _ in self.id_networks]
+        for position, student1 in enumerate(table.student1):
+            network_positions[index[student1]].append(position)
+        self.network_positions = [array('l', sorted(positions, key=(lambda position: (-lines[position], position))))
+                                  for positions in network_positions]
+        # Best percentage of either file of each match
+        self.best_perc = array('B', map(max, table.perc1, table.perc2))
+        self._kept = dict()
+
+    def kept_positions(self, threshold: int) -> [array]:
+        """
+        :param threshold: lowest percentage kept
+        :return: for every network, its matches where either file is matched at threshold percent or more
+        """
+        kept = self._kept.get(threshold)
+        if kept is None:
+            best_perc = self.best_perc
+            kept = self._kept[threshold] = [
+                positions if all(best_perc[position] >= threshold for position in positions) else
+                array('l', (position for position in positions if best_perc[position] >= threshold))
+                for positions in self.network_positions]
+        return kept
+
+    def filter(self, threshold: int, partners=(), current=None) -> [array]:
+        """
+        :param threshold: lowest percentage kept
+        :param partners: PartnerIndex; networks of just a pair of partners are dropped
+        :param current: names of the current students; networks without any are dropped (None keeps every network)
+        :return: rows of the kept matches, grouped by network, with the networks and their matches sorted by
+                 decreasing lines matched
+        """
+        ids = self.table.ids
+        current = None if current is None else {ids[student] for student in current if student in ids}
+        lines = self.table.lines
+        networks = [kept for kept, id_network, network in zip(self.kept_positions(threshold), self.id_networks,
+                                                                self.networks)
+                    if kept and (current is None or not current.isdisjoint(id_network)) and network not in partners]
+        networks.sort(key=(lambda net: (-lines[net[0]], net[0])))
+        return networks
+
+
+class ReportSnapshot:
+    """
+    The parsed matches of a report (merged across shards, with identical
+    files added back) and its header information, saved in a compact
+    binary file so the report can be re-opened, re-filtered or compared
+    without downloading its results index again.
+    The file holds SNAPSHOT_MAGIC, the length of a JSON header describing
+    the report and the table's columns, the header and then the raw bytes
+    of each column of the MatchTable.
+    """
+    SNAPSHOT_MAGIC = b'MOSSUCI-SNAPSHOT\n'
+    VERSION = 1
+
+    def __init__(self, table: MatchTable, urls: [str], date_info: str, option_info: str, error_info='',
+                 duplicate_info=''):
+        """
+        :param table: MatchTable holding the matches
+        :param urls: url of the results index of every shard, the first being the report's url
+        :param date_info: date of the report
+        :param option_info: options the report was submitted with
+        :param error_info: errors listed by the report(s)
+        :param duplicate_info: identical files dropped before uploading
+        """
+        self.table = table
+        self._graph = None
+        self.urls = [url.rstrip('/') for url in urls]
+        self.date_info = date_info
+        self.option_info = option_info
+        self.error_info = error_info
+        self.duplicate_info = duplicate_info
+
+    @property
+    def graph(self) -> MatchGraph:
+        """
+        :return: the networks of the report's matches, built on first use
+        """
+        if self._graph is None:
+            self._graph = MatchGraph(self.table)
+        return self._graph
+
+    def save(self, path):
+        """
+        :param path: file to write the snapshot to
+        :return: None
+        """
+        table = self.table
+        header = {'version': self.VERSION, 'byteorder': sys.byteorder, 'urls': self.urls,
+                  'date_info': self.date_info, 'option_info': self.option_info, 'error_info': self.error_info,
+                  'duplicate_info': self.duplicate_info, 'names': table.names, 'results': table.results,
+                  'columns': [[name, getattr(table, name).typecode, getattr(table, name).itemsize, len(table)]
+                              for name in MatchTable.COLUMNS]}
+        header = json.dumps(header).encode('utf-8')
+        with open(path, 'wb') as snapshot:
+            snapshot.write(self.SNAPSHOT_MAGIC)
+            snapshot.write(struct.pack('<I', len(header)))
+            snapshot.write(header)
+            for name in MatchTable.COLUMNS:
+                getattr(table, name).tofile(snapshot)
+
+    @classmethod
+    def load(cls, path) -> 'ReportSnapshot':
+        """
+        :param path: file written by save
+        :return: the saved snapshot
+        """
+        with open(path, 'rb') as snapshot:
+            if snapshot.read(len(cls.SNAPSHOT_MAGIC)) != cls.SNAPSHOT_MAGIC:
+                raise ValueError(f'{path} is not a report snapshot')
+            header_length, = struct.unpack('<I', snapshot.read(4))
+            header = json.loads(snapshot.read(header_length).decode('utf-8'))
+            if header['version'] != cls.VERSION:
+                raise ValueError(f'Unsupported report snapshot version {header["version"]}')
+            table = MatchTable()
+            table.names = header['names']
+            table.ids = {name: student for student, name in enumerate(table.names)}
+            table.results = header['results']
+            table._result_ids = {result: position for position, result in enumerate(table.results)}
+            for name, typecode, itemsize, count in header['columns']:
+                column = array(typecode)
+                if column.itemsize != itemsize or name not in MatchTable.COLUMNS:
+                    raise ValueError(f'Report snapshot column {name} cannot be read on this platform')
+                try:
+                    column.fromfile(snapshot, count)
+                except EOFError:
+                    raise ValueError(f'{path} is truncated') from None
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                setattr(table, name, column)
+        return cls(table, header['urls'], header['date_info'], header['option_info'], header['error_info'],
+                   header['duplicate_info'])
+
+    def pair_lines(self) -> {frozenset: (int, int)}:
+        """
+        :return: the position and number of lines matched of every pair of students, by pair
+        """
+        table = self.table
+        return {frozenset((table.names[student1], table.names[student2])): (position, table.lines[position])
+                for position, (student1, student2) in enumerate(table.pairs())}
+
+    def diff(self, newer: 'ReportSnapshot') -> ([MatchRecord], [MatchRecord], [(MatchRecord, MatchRecord)]):
+        """
+        Compares the matches of two reports by pair of students.
+        :param newer: snapshot of the later report
+        :return: tuple of the matches only in newer, the matches only in this report and the
+                 (old, new) matches whose number of lines matched changed
+        """
+        old_pairs, new_pairs = self.pair_lines(), newer.pair_lines()
+        added = [newer.table.record(position) for pair, (position, _) in new_pairs.items() if pair not in old_pairs]
+        removed = [self.table.record(position) for pair, (position, _) in old_pairs.items() if pair not in new_pairs]
+        changed = [(self.table.record(old_pairs[pair][0]), newer.table.record(position))
+                   for pair, (position, lines) in new_pairs.items()
+                   if pair in old_pairs and old_pairs[pair][1] != lines]
+        return added, removed, changed
+
+
+class ReportEntry:
+    """
+    A row of a filtered report, as read by the report template and the
+    Submit tab (entry['student1'] and so on).
+    """
+    __slots__ = ('student1', 'student2', 'perc1', 'perc2', 'lines', 'url', 'partnered')
+
+    def __init__(self, student1: str, student2: str, perc1: int, perc2: int, lines: int, url, partnered: str):
+        self.student1 = student1
+        self.student2 = student2
+        self.perc1 = perc1
+        self.perc2 = perc2
+        self.lines = lines
+        self.url = url
+        self.partnered = partnered
+
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+
+    def keys(self) -> (str,):
+        return self.__slots__
+
+    def items(self) -> [(str,)]:
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+
+class ReportEntries:
+    """
+    The entries of a filtered report, built on demand from a MatchTable:
+        the ReportEntry of every match of each network, each network being
+        followed by None.
+    """
+
+    def __init__(self, table: MatchTable, networks: [[int]], result_id: str, archive=False, partners=None,
+                 graph=None):
+        """
+        :param table: MatchTable holding the matches
+        :param networks: rows of the table to show, grouped by network
+        :param result_id: id of the (first) result of the report
+        :param archive: link to the archived match pages instead of the MOSS server
+        :param partners: PartnerIndex of the partnered pairs
+        :param graph: MatchGraph of the table the networks were selected from, if any
+        """
+        self.table = table
+        self.networks = networks
+        self.result_id = result_id
+        self.archive = archive
+        self.partners = PartnerIndex() if partners is None else partners
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return sum(len(network) for network in self.networks) + len(self.networks)
+
+    def __iter__(self):
+        for group_num, network in enumerate(self.networks):
+            for position in network:
+                yield self.entry(group_num, position)
+            yield None
+
+    def match_directory(self, group_num: int, position: int) -> pathlib.Path:
+        """
+        :return: directory, relative to the report, the match pages of the row are archived in
+        """
+        # Matches of other shards are archived in a sub directory named after their result
+        match_result = self.table.result_id(position)
+        return pathlib.Path(f'group{group_num}') if match_result == self.result_id else pathlib.Path(
+            f'group{group_num}', match_result)
+
+    def entry(self, group_num: int, position: int) -> ReportEntry:
+        table = self.table
+        match_num = table.match_num[position]
+        student1, student2 = table.names[table.student1[position]], table.names[table.student2[position]]
+        if match_num < 0:
+            url = ''
+        elif self.archive:
+            url = self.match_directory(group_num, position).joinpath(f'match{match_num}.html')
+        else:
+            url = f"http://moss.stanford.edu/results/{table.result_id(position)}/match{match_num}.html"
+        return ReportEntry(student1, student2, table.perc1[position], table.perc2[position], table.lines[position],
+                           url, 'Y' if self.partners.partnered(student1, student2) else '')
+
+    def network_summary(self, group_num: int) -> dict:
+        """
+        :return: number, match count, most lines matched and students of a network
+        """
+        table = self.table
+        network = self.networks[group_num]
+        students = {table.names[student] for position in network
+                    for student in (table.student1[position], table.student2[position])}
+        return {'network': group_num + 1, 'matches': len(network), 'lines': table.lines[network[0]] if network else 0,
+                'students': sorted(students)}
+
+    def write_jsonl(self, path, report_info: dict):
+        """
+        Writes the report as JSON Lines, one network or match at a time: a
+            "report" line with report_info, then every network's "network"
+            line followed by a "match" line for each of its matches.
+        :param path: file to write
+        :param report_info: statistics and header information of the report
+        :return: None
+        """
+        with open(path, 'w', encoding='utf-8') as export:
+            export.write(json.dumps(dict(type='report', **report_info)) + '\n')
+            for group_num, network in enumerate(self.networks):
+                export.write(json.dumps(dict(type='network', **self.network_summary(group_num))) + '\n')
+                for position in network:
+                    entry = self.entry(group_num, position)
+                    export.write(json.dumps({'type': 'match', 'network': group_num + 1, 'student1': entry.student1,
+                                             'perc1': entry.perc1, 'student2': entry.student2, 'perc2': entry.perc2,
+                                             'lines': entry.lines, 'partnered': bool(entry.partnered),
+                                             'url': str(entry.url)}) + '\n')
+
+    def write_csv(self, path):
+        """
+        Writes a row for every match of the report, with the number of its network.
+        :param path: file to write
+        :return: None
+        """
+        with open(path, 'w', encoding='utf-8', newline='') as export:
+            writer = csv.writer(export)
+            writer.writerow(('network', 'student1', 'perc1', 'student2', 'perc2', 'lines', 'partnered', 'url'))
+            for group_num, network in enumerate(self.networks):
+                writer.writerows((group_num + 1, entry.student1, entry.perc1, entry.student2, entry.perc2,
+                                  entry.lines, entry.partnered, entry.url)
+                                 for entry in (self.entry(group_num, position) for position in network))
+
+
+class ReportIndex:
+    """
+    Search index over the entries of a filtered report: a prefix trie of
+    the students' names, the networks each student appears in, and the
+    rows of the report sorted by lines matched (and, once asked for, by
+    percentage matched).
+    """
+
+    def __init__(self, entries: ReportEntries):
+        """
+        :param entries: entries of the report
+        """
+        self.entries = entries
+        table = entries.table
+        self._trie = {}
+        self.student_networks = defaultdict(list)
+        rows = array('l')
+        groups = array('l')
+        for group_num, network in enumerate(entries.networks):
+            students = set()
+            for position in network:
+                students.add(table.student1[position])
+                students.add(table.student2[position])
+                rows.append(position)
+                groups.append(group_num)
+            for student in students:
+                self.student_networks[table.names[student]].append(group_num)
+        for name in self.student_networks:
+            node = self._trie
+            for character in name:
+                node = node.setdefault(character, {})
+            # None marks the end of a name
+            node[None] = name
+        self._rows = rows
+        self._groups = groups
+        lines = table.lines
+        self.by_lines = array('l', sorted(range(len(rows)), key=(lambda row: -lines[rows[row]])))
+        self._by_perc = None
+
+    @property
+    def by_perc(self) -> array:
+        """
+        :return: rows of the report sorted by the higher percentage of the two files, then by lines matched
+        """
+        if self._by_perc is None:
+            table, rows = self.entries.table, self._rows
+            # The filtered networks' graph already holds each match's best percentage
+            graph = self.entries.graph
+            best_perc = graph.best_perc if graph is not None else array('B', map(max, table.perc1, table.perc2))
+            lines = table.lines
+            self._by_perc = array('l', sorted(range(len(rows)), key=(lambda row: (-best_perc[rows[row]],
+                                                                                   -lines[rows[row]]))))
+        return self._by_perc
+
+    def complete(self, prefix: str, limit=None) -> [str]:
+        """
+        :param prefix: start of a student's name (case insensitive, as names are lower case)
+        :param limit: most names returned (None for all)
+        :return: names of the students of the report starting with prefix, in alphabetical order
+        """
+        node = self._trie
+        for character in prefix.lower():
+            node = node.get(character)
+            if node is None:
+                return []
+        names = []
+        stack = [node]
+        while stack and (limit is None or len(names) < limit):
+            node = stack.pop()
+            if None in node:
+                names.append(node[None])
+            stack.extend(node[character] for character in sorted((key for key in node if key is not None),
+                                                                 reverse=True))
+        return names
+
+    def networks_of(self, prefix: str) -> [int]:
+        """
+        :param prefix: start of the students' names
+        :return: numbers (from 0) of the networks holding a student whose name starts with prefix, in report order
+        """
+        return sorted({group_num for name in self.complete(prefix) for group_num in self.student_networks[name]})
+
+    def top(self, count: int, by='lines') -> [(int, int)]:
+        """
+        :param count: number of matches
+        :param by: 'lines' or 'perc' (the higher percentage of the two files)
+        :return: (network number from 0, table row) of the count matches of the report matching the most
+        """
+        order = self.by_lines if by == 'lines' else self.by_perc
+        return [(self._groups[row], self._rows[row]) for row in order[:count]]
+
+
 class MossUCI(mosspy.Moss):
     """
     A modified version of the Moss handler class built to streamline
@@ -58,6 +1536,28 @@ class MossUCI(mosspy.Moss):
         self.debug = debug
         self.template_values = dict()
         self.cur_stu_deactivated = False
+        self.networks = []
+        self.network_index = dict()
+        self.match_table = None
+        self.download_workers = 4
+        self.request_interval = 0.1
+        self.cache = PageCache()
+        self.upload_chunk_size = 64 * 1024
+        self.results_chunk_size = 64 * 1024
+        self.report_page_size = 0
+        self.report_workers = 4
+        self.deduplicate = True
+        self.normalise_whitespace = True
+        self.duplicates = dict()
+        self.saved_bytes = 0
+        # source_key of every past student's file
+        self.past_files = set()
+        # StoredDigests of the records added with them (such as the past student corpus), by source_key
+        self.digests = dict()
+        self.shards = 1
+        self.shard_urls = []
+        self.export_formats = ()
+        self.snapshot = None
 
     def deactivate_current_students(self):
         self.cur_stu_deactivated = True
@@ -66,7 +1566,7 @@ class MossUCI(mosspy.Moss):
         self.cur_stu_deactivated = False
 
     def filter_report(self, path: str, partners=(('', ''),), archive=False, zip_report=False, network_threshold=-1,
-                      to_filter=True):
+                      to_filter=True, progress=None, checkpoint=None):
         """
         Based off of the information loaded into the class instance
             (ie. the current vs. old students and report url), cache
@@ -84,20 +1584,36 @@ class MossUCI(mosspy.Moss):
                 Networks are separated by horizontal lines and sorted by
                 decreasing importance.
                 Matches between partners are marked as such.
+                When the report_page_size attribute is set, report.html
+                instead lists the networks (report_page_size per page) and
+                each network gets its own pages in its groupN directory.
+                The formats listed in the export_formats attribute (see
+                EXPORT_FORMATS) are written next to it: report.jsonl,
+                report.csv and report.snapshot (see ReportSnapshot).
             5. Download dependent resources if indicated within the
                 filter_report call.
             6. Compress the entire directory if indicated within the
                 filter_report call.
+            When the submission was sharded (see send), the reports of every
+            url in shard_urls are merged before any of the above.
+            The parsed report is kept in the snapshot attribute and reused
+            (instead of reading the results again) while the urls match, as
+            it is after load_snapshot. Steps 1 to 3 are done by refilter, which
+            can be called again on its own to change the threshold, partners
+            or current students.
         :param path: string storing a path to an existing directory to generate the report in.
-        :param partners: an iterable object of two tuples (that supports the self.__contains__ call)
-                        that represents partners
+        :param partners: PartnerIndex, or an iterable object of two tuples that represents partners
         :param archive: boolean value indicating whether or not to archive dependent information for the report.
         :param zip_report: boolean value indicating whether or not to compress the directory once finished.
         :param network_threshold: set a line-based threshold to filter networks (removes matches
                                     under the given threshold)
         :param to_filter: boolean value indicating whether or not to filter the report or not (allowing for archival of
                         original report)
-        :return: None
+        :param progress: optional callable receiving (completed, total, destination) as each archived
+                        resource is saved
+        :param checkpoint: optional callable called while the results are read and the report is written;
+                        it may raise to abandon the report (as Job.checkpoint does once the job is cancelled)
+        :return: path to the generated report directory (or zip file when zip_report is set)
         """
         # Setup and check assertions
         if self.debug:
@@ -108,108 +1624,52 @@ class MossUCI(mosspy.Moss):
         assert path.exists(), f'Path {path.as_posix()} does not exist.'
         assert path.is_dir(), f'Path {path.as_posix()} does not lead to a directory.'
 
-        def _reachable(graph: {str: {str}}, start: str) -> {str}:
-            reached_set, exploring_list = set(), [start]
-            while exploring_list:
-                node_to_explore = exploring_list.pop(0)
-                reached_set.add(node_to_explore)
-                exploring_list += [node for node in graph.get(node_to_explore, []) if node not in reached_set]
-            return reached_set
-
         if len(self.url) == 0:
             raise Exception("Empty url supplied")
 
         # Parse URL
         result_id = self.url.split('/')[-1]
         self.template_values['resultID'] = result_id
+        result_urls = [self.url] + [url for url in self.shard_urls if url.rstrip('/') != self.url.rstrip('/')]
 
-        # Load Data
-        if self.debug:
-            print(result_id)
-            print('opening base url...')
-        response = urlopen(self.url)
-        content = response.read().decode('utf-8')
-
-        # Scrape Option info, date
-        # TODO: Scrape error msgs
-        if self.debug:
-            print('parsing data...')
-        self.template_values['date_info'] = re.search(r'Moss Results<p>\s(?P<date>.+)\s<p>\sOptions',
-                                                      content).group('date')
-
-        self.template_values['option_info'] = re.search(r'<p>\sOptions (?P<options>.+)\s<HR>', content).group('options')
-
-        if '-d' in self.template_values['option_info']:
-            self.current_quarter_students = {f"{student.split('/')[0]}/" for student in self.current_quarter_students}
-            partners = {frozenset((s + '/', p + '/')) for s, p in partners}
+        # Load Data and scrape matches, unless they are already held in a snapshot of this report
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.urls != [url.rstrip('/') for url in result_urls]:
+            parsed = []
+            for result_url in result_urls:
+                if self.debug:
+                    print(result_url.split('/')[-1])
+                    print('opening base url...')
+                parsed.append(self._read_results(result_url, checkpoint))
 
-        self.template_values['error_info'] = 'Not Implemented Yet'
-
-        # Scrape mathes
-        content = content.lower()
-        click_pattern = re.compile(
-            r'<tr><td><a href=\"(?P<url>http://moss\.stanford\.edu/results/\d+/\d+/match(?P<match_num>\d+)\.html)\">'
-            r'(?P<student1>.+) \((?P<perc1>\d{1,2})%\)</a>\s*<td><a href=\"http://moss\.stanford\.edu/results/\d+/\d+/match'
-            r'\d+\.html\">(?P<student2>.+) \((?P<perc2>\d{1,2})%\)</a>\s*<td align=right>(?P<lines>\d+)')
-        matches = re.findall(click_pattern, content)
+            if len(parsed) == 1:
+                table = parsed[0][1]
+            else:
+                table = merge_shards([shard_table for _, shard_table in parsed], self.current_quarter_students)
+            if self.duplicates:
+                table = MatchTable(expand_duplicates(table, self.duplicates))
+            parser = parsed[0][0]
+            snapshot = self.snapshot = ReportSnapshot(
+                table, result_urls, parser.date_info, parser.option_info,
+                '<p>'.join(parser.error_info for parser, _ in parsed if parser.error_info),
+                ', '.join(f"{group.name} ({', '.join(group.uploaded + group.copies)})"
+                          for group in self.duplicates.values()))
+        table = snapshot.table
+        self.template_values['date_info'] = snapshot.date_info
+        self.template_values['option_info'] = snapshot.option_info
+        self.template_values['error_info'] = snapshot.error_info
+        self.template_values['duplicate_info'] = snapshot.duplicate_info
 
         if to_filter:
-            # Generate connection network
-            student_graph = defaultdict(set)
-            for pair in matches:
-                student_graph[pair[2]].add(pair[4])
-                student_graph[pair[4]].add(pair[2])
-            if self.debug:
-                print('generating networks...')
-
-            # Filter network by current quarter and remove networks of just partners
-            networks = tuple(
-                {frozenset(network) for network in [_reachable(student_graph, student) for student in student_graph]
-                 if (self.cur_stu_deactivated or any(
-                    student in self.current_quarter_students for student in network)) and network not in partners})
-
-            student_lookup = {student: {match[1] for match in matches if student in match} for web in networks for
-                              student
-                              in web}
-
-            match_line_lookup = {match_num: int(matches[match_num][6]) for match_num in range(len(matches))}
-
-            # Cycle through matches (to retain order) and retrieve scraped match data
-            self.template_values['entries'] = []
-            if self.debug:
-                print('creating template...')
-
-            network_by_matches = [
-                sorted(
-                    [group for group in {match_number for student in net for match_number in student_lookup[student] if
-                                         int(matches[int(match_number)][3]) >= network_threshold or int(
-                                             matches[int(match_number)][5]) >= network_threshold} if group],
-                    key=(lambda entry: -match_line_lookup[int(entry)])) for net in networks]
-            network_by_matches = [net for net in network_by_matches if net != []]
-            network_by_matches = sorted(network_by_matches,
-                                        key=(
-                                            lambda entry: max(entry,
-                                                              key=(lambda ent: match_line_lookup.get(int(ent),
-                                                                                                     0))))) if network_by_matches else network_by_matches
+            entries = self.refilter(partners, network_threshold, archive)
         else:
-            self.template_values['entries'] = []
-            network_by_matches = [[num for num in range(len(matches))]]
-        for group_num, network in enumerate(network_by_matches):
-            for match_num in network:
-                url, match_num, student1, perc1, student2, perc2, lines, = matches[int(match_num)]
-                self.template_values['entries'].append({'student1': student1,
-                                                        'student2': student2,
-                                                        'perc1': perc1,
-                                                        'perc2': perc2,
-                                                        'lines': lines,
-                                                        'url': pathlib.Path(f'group{group_num}').joinpath(
-                                                            f'match{match_num}.html') if archive else
-                                                        f"http://moss.stanford.edu/results/{result_id}/"
-                                                        f"match{match_num}.html",
-                                                        'partnered': 'Y' if frozenset(
-                                                            (student1,
-                                                             student2)) in partners else ''})
-            self.template_values['entries'].append(None)
+            self.match_table = table
+            entries = ReportEntries(table, [array('l', range(len(table)))], result_id, archive,
+                                    self._report_partners(partners))
+            self._count_entries(entries)
+        network_by_matches = entries.networks
+        if checkpoint is not None:
+            checkpoint()
 
         # Create directory for report
         directory = path.joinpath('moss_report__' + str(datetime.datetime.now().timestamp()).replace('.', '_'))
@@ -217,39 +1677,72 @@ class MossUCI(mosspy.Moss):
 
         # Download match resources (if archiving locally)
         if archive:
-            server = re.match(r"http://moss.stanford.edu/results/(?P<server>\d+)/.*", self.url).groupdict()['server']
             if self.debug:
                 print('Saving Resources...')
+            shard_urls = {url.rstrip('/').split('/')[-1]: url.rstrip('/') for url in result_urls}
+
+            def _result_url_stripper(match_result: str):
+                def _strip_result_url(contents: str) -> str:
+                    return contents.replace(f'http://moss.stanford.edu/results/{match_result}/', '')
+
+                return _strip_result_url
+
+            strippers = {match_result: _result_url_stripper(match_result) for match_result in shard_urls}
+            jobs = []
             for net, network in enumerate(network_by_matches):
                 directory.joinpath('group' + str(net)).mkdir()
-                for match_id in network:
+                for position in network:
+                    match_id = table.match_num[position]
+                    if match_id < 0:
+                        # Identical copies dropped before uploading have no match page
+                        continue
+                    match_result = table.result_id(position)
+                    match_url = shard_urls.get(match_result, self.url.rstrip('/'))
+                    match_directory = directory.joinpath(entries.match_directory(net, position))
+                    match_directory.mkdir(exist_ok=True)
                     for resource in ('', '-0', '-1', '-top'):
-                        f = open(directory.joinpath(
-                            pathlib.Path('group' + str(net)).joinpath('match' + match_id + resource + '.html')), 'w')
-                        resource_contents = urlopen(
-                            f'{BASE_URL}/{server}/{result_id}/match{match_id}{resource}.html').read().decode()
-                        if resource == '-top':
-                            resource_contents = resource_contents.replace(
-                                f'http://moss.stanford.edu/results/{result_id}/', '')
-                        f.write(resource_contents)
-                        f.close()
-                        # Timeout to avoid being marked as spam by server
-                        # time.sleep(0.1)
-
-        self.template_values['original_length'] = len(matches)
-        self.template_values['modified_length'] = len([num for net in network_by_matches for num in net])
-        self.template_values['filtered'] = self.template_values['original_length'] - self.template_values[
-            'modified_length']
+                        jobs.append((f'{match_url}/match{match_id}{resource}.html',
+                                     match_directory.joinpath(f'match{match_id}{resource}.html'),
+                                     strippers.get(match_result) if resource == '-top' else None))
+
+            def _report_progress(completed: int, total: int, destination: pathlib.Path):
+                if checkpoint is not None:
+                    checkpoint()
+                if self.debug:
+                    print(f'saved {destination.name} ({completed}/{total})')
+                if progress is not None:
+                    progress(completed, total, destination)
+
+            downloader = ResourceDownloader(self.download_workers, self.request_interval, cache=self.cache)
+            downloader.download(jobs, _report_progress)
+
+        # Write the machine readable exports
+        if 'jsonl' in self.export_formats:
+            entries.write_jsonl(directory.joinpath('report.jsonl'), {
+                key: self.template_values[key] for key in ('resultID', 'date_info', 'option_info', 'error_info',
+                                                           'duplicate_info', 'original_length', 'modified_length',
+                                                           'filtered')})
+        if 'csv' in self.export_formats:
+            entries.write_csv(directory.joinpath('report.csv'))
+        if 'snapshot' in self.export_formats:
+            snapshot.save(directory.joinpath('report.snapshot'))
 
         # Write Data to report
         if self.debug:
             print('loading template...')
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader('templates'))
-        template = env.get_template('index.html')
-        if self.debug:
-            print('Generating report index...')
-        with directory.joinpath('report.html').open('w') as report:
-            report.write(template.render(self.template_values))
+        if self.report_page_size > 0:
+            if self.debug:
+                print('Generating paginated report...')
+            self._write_paginated_report(directory, entries)
+        else:
+            template = template_environment().get_template('index.html')
+            if self.debug:
+                print('Generating report index...')
+            with directory.joinpath('report.html').open('w') as report:
+                # Written as it is rendered, a few rows at a time
+                stream = template.stream(self.template_values)
+                stream.enable_buffering(64)
+                stream.dump(report)
         if self.debug:
             print(f'Finished Generating Report: {directory.joinpath("report.html")}')
 
@@ -257,52 +1750,301 @@ class MossUCI(mosspy.Moss):
         if zip_report:
             if self.debug:
                 print('compressing report...')
-            make_archive(directory, 'zip', directory)
+            archive_path = make_archive(directory, 'zip', directory)
             if self.debug:
                 print('deleting un-ziped archive')
             rmtree(directory)
+            return pathlib.Path(archive_path)
+        return directory
+
+    def _report_partners(self, partners):
+        """
+        Names current students and partners the way the report does: by
+            directory (student/) when it was submitted in directory mode.
+        :param partners: PartnerIndex, or iterable of partnered pairs
+        :return: the partners as a PartnerIndex, renamed if needed
+        """
+        partners = PartnerIndex.of(partners)
+        if '-d' in self.snapshot.option_info:
+            self.current_quarter_students = {f"{student.split('/')[0]}/" for student in self.current_quarter_students}
+            partners = partners.directory_mode()
+        return partners
+
+    def _count_entries(self, entries: ReportEntries):
+        self.template_values['entries'] = entries
+        self.template_values['original_length'] = len(entries.table)
+        self.template_values['modified_length'] = sum(len(network) for network in entries.networks)
+        self.template_values['filtered'] = self.template_values['original_length'] - self.template_values[
+            'modified_length']
+
+    def refilter(self, partners=(), network_threshold=-1, archive=False) -> ReportEntries:
+        """
+        Filters the report parsed by the last filter_report (or load_snapshot)
+            again, steps 1 to 3 of filter_report, without reading or writing
+            anything: its networks are kept in snapshot.graph, so only the
+            networks and matches kept are selected again. The entries and
+            counts of template_values are updated.
+        :param partners: PartnerIndex, or an iterable object of two tuples that represents partners
+        :param network_threshold: remove matches under the given percentage threshold
+        :param archive: link the entries to archived match pages instead of the MOSS server
+        :return: the filtered ReportEntries
+        """
+        if self.snapshot is None:
+            raise ConnectionAbortedError('No parsed report to filter')
+        partners = self._report_partners(partners)
+        if self.debug:
+            print('filtering networks...')
+        graph = self.snapshot.graph
+        self.networks = graph.networks
+        self.network_index = graph.network_index
+        self.match_table = graph.table
+        networks = graph.filter(network_threshold, partners,
+                                None if self.cur_stu_deactivated else self.current_quarter_students)
+        entries = ReportEntries(graph.table, networks, self.snapshot.urls[0].split('/')[-1], archive, partners,
+                                graph)
+        self._count_entries(entries)
+        return entries
+
+    def load_snapshot(self, path) -> ReportSnapshot:
+        """
+        Loads a report saved by filter_report (see export_formats) so it
+            can be filtered again without reading its results index.
+        :param path: path to the report.snapshot file
+        :return: the loaded ReportSnapshot
+        """
+        self.snapshot = ReportSnapshot.load(path)
+        self.shard_urls = list(self.snapshot.urls)
+        self.url = self.shard_urls[0]
+        self.sent = True
+        return self.snapshot
+
+    def _write_paginated_report(self, directory: pathlib.Path, entries: ReportEntries):
+        """
+        Writes the report as summary pages listing the networks (report.html,
+            report_2.html, ...) and, for every network, pages of at most
+            report_page_size matches in its groupN directory (index.html,
+            page_2.html, ...), next to any archived match pages.
+            Network pages are written on report_workers threads.
+        :param directory: report directory
+        :param entries: entries of the report
+        :return: None
+        """
+        page_size = self.report_page_size
+        network_template = template_environment().get_template('network.html')
+
+        def _page_names(count: int, first: str, prefix: str) -> [str]:
+            return [first] + [f'{prefix}_{number}.html' for number in range(2, count + 1)]
+
+        def _write_network(group_num: int) -> dict:
+            network = entries.networks[group_num]
+            group = pathlib.Path(f'group{group_num}')
+            directory.joinpath(group).mkdir(exist_ok=True)
+            pages = [network[start:start + page_size] for start in range(0, len(network), page_size)]
+            page_names = _page_names(len(pages), 'index.html', 'page')
+            for page, positions in enumerate(pages, 1):
+                rows = []
+                for position in positions:
+                    entry = entries.entry(group_num, position)
+                    if entries.archive and entry.url:
+                        # Pages are in the group directory, next to its match pages
+                        entry.url = entry.url.relative_to(group)
+                    rows.append(entry)
+                with directory.joinpath(group, page_names[page - 1]).open('w') as network_page:
+                    network_template.stream(dict(self.template_values, entries=rows, network=group_num + 1, page=page,
+                                                 pages=page_names, summary_url='../report.html')).dump(network_page)
+            summary = entries.network_summary(group_num)
+            return dict(summary, number=summary['network'], url=f'{group.as_posix()}/index.html')
+
+        with ThreadPoolExecutor(max_workers=self.report_workers) as executor:
+            networks = list(executor.map(_write_network, range(len(entries.networks))))
+
+        summary_template = template_environment().get_template('summary.html')
+        summaries = [networks[start:start + page_size] for start in range(0, len(networks), page_size)] or [[]]
+        summary_names = _page_names(len(summaries), 'report.html', 'report')
+        for page, summary in enumerate(summaries, 1):
+            with directory.joinpath(summary_names[page - 1]).open('w') as summary_page:
+                summary_template.stream(dict(self.template_values, networks=summary, page=page,
+                                             pages=summary_names)).dump(summary_page)
+
+    def _read_results(self, result_url: str, checkpoint=None) -> (ResultsParser, MatchTable):
+        """
+        Streams a results index page through a ResultsParser, from the cache
+            if possible, otherwise from the server while copying it into the cache.
+        :param result_url: url of the results index
+        :param checkpoint: optional callable called before each chunk is parsed
+        :return: tuple of the parser (holding the date, options and errors) and the scraped matches
+        """
+        parser = ResultsParser()
+        matches = MatchTable()
+        cached = self.cache.open(result_url) if self.cache is not None else None
+        if cached is not None:
+            with cached:
+                for chunk in iter(lambda: cached.read(self.results_chunk_size), b''):
+                    if checkpoint is not None:
+                        checkpoint()
+                    matches.extend(parser.feed(chunk))
+            matches.extend(parser.close())
+            return parser, matches
+
+        staged = self.cache.stage(result_url) if self.cache is not None else None
+        try:
+            with urlopen(result_url) as response:
+                copy = staged.open('wb') if staged is not None else None
+                try:
+                    if self.debug:
+                        print('parsing data...')
+                    for chunk in iter(lambda: response.read(self.results_chunk_size), b''):
+                        if checkpoint is not None:
+                            checkpoint()
+                        if copy is not None:
+                            copy.write(chunk)
+                        matches.extend(parser.feed(chunk))
+                    matches.extend(parser.close())
+                finally:
+                    if copy is not None:
+                        copy.close()
+        except BaseException:
+            # Only complete, parsable pages are cached
+            if staged is not None and staged.exists():
+                staged.unlink()
+            raise
+        if staged is not None:
+            self.cache.commit(result_url, staged)
+        return parser, matches
+
+    @staticmethod
+    def _add_source(files: list, file_path, display_name: str, caller: str):
+        """
+        Appends a file path or ZipMember to files, with the same checks as
+            mosspy.Moss.addFile.
+        """
+        if isinstance(file_path, ZipMember):
+            if file_path.size <= 0:
+                raise Exception(f"{caller}({file_path}) => File Not Found")
+        elif not (os.path.isfile(file_path) and os.path.getsize(file_path) > 0):
+            raise Exception(f"{caller}({file_path}) => File Not Found")
+        files.append((file_path, display_name))
+
+    @lock_after_send
+    def addBaseFile(self, file_path, display_name=None):
+        """
+        Adds a base file, which MOSS ignores similarities to.
+        :param file_path: string representing a path to the desired file, or a ZipMember.
+        :param display_name: string representing the name to display for the file.
+        :return: None
+        """
+        if self.debug:
+            print(f'adding base file: {display_name if display_name else file_path}')
+        self._add_source(self.base_files, file_path, display_name, 'addBaseFile')
 
     @lock_after_send
-    def addFile(self, file_path: str, display_name: str):
+    def addFile(self, file_path, display_name: str):
         """
-        Calls super.addFile with corresponding information.
+        Adds a current student's file.
         Adds the display_name to a list of students to keep during
             the filtration process.
-        :param file_path: string representing a path to the desired file.
+        :param file_path: string representing a path to the desired file, or a ZipMember.
         :param display_name: string representing the name to display for the file.
         :return: None
         """
         if self.debug:
             print(f'adding file: {display_name if display_name else file_path}')
         self.current_quarter_students.add(
-            display_name if display_name else re.search(r'_(?P<uciID>\w+)uci\.edu', file_path).group('uciID'))
-        super(MossUCI, self).addFile(file_path, display_name)
+            display_name if display_name else re.search(r'_(?P<uciID>\w+)uci\.edu', str(file_path)).group('uciID'))
+        self._add_source(self.files, file_path, display_name, 'addFile')
 
     @lock_after_send
-    def add_old_students(self, file_path: str, display_name: str):
+    def add_old_students(self, file_path, display_name: str):
         """
-        Calls super.addFile with corresponding information.
+        Adds a past student's file.
             Does not add students to the current_quarter list and
             therefore ignores students added by this method during
             report generation.
-        :param file_path: string representing a path to the desired file.
+        :param file_path: string representing a path to the desired file, or a ZipMember.
         :param display_name: string representing the name to display for the file.
         :return: None
         """
         if self.debug:
             print(f'adding file: {display_name if display_name else file_path}')
-        mosspy.Moss.addFile(self, file_path, display_name)
+        self._add_source(self.files, file_path, display_name, 'addFile')
+        self.past_files.add(source_key(file_path))
 
     @lock_after_send
-    def send(self) -> str:
+    def add_records(self, records: [FileRecord]):
         """
-        Calls super.send, but also sets the sent attribute to True and
-            sets the url attribute to the returning information.
-        :return: URL as string
+        Adds every record to the submission using the method matching its
+            group (addBaseFile, addFile or add_old_students), keeping the
+            StoredDigests of records that have them for find_duplicates.
+        :param records: iterable of FileRecord
+        :return: None
+        """
+        add_functions = {BASE: self.addBaseFile, CURRENT: self.addFile, PAST: self.add_old_students}
+        for record in records:
+            add_functions[record.group](record.path, record.display_name)
+            if record.digests is not None:
+                self.digests[source_key(record.path)] = record.digests
+
+    @lock_after_send
+    def send(self, progress=None) -> str:
+        """
+        Streams the submission through a SubmissionUploader, sets the sent
+            attribute to True and sets the url attribute to the returning
+            information.
+        Unless the deduplicate attribute is cleared, files added twice,
+            duplicated base files and copies of a file beyond what the ignore
+            limit needs are not uploaded (see find_duplicates); the copies are
+            added back to the report by filter_report and the bytes skipped
+            are kept in saved_bytes.
+        When the shards attribute is above 1, the past students' files are
+            split into that many partitions and each partition is submitted
+            concurrently along with the base files and every current student.
+            The url attribute is set to the first report and shard_urls to
+            all of them, which filter_report merges back into one report.
+        :param progress: optional callable receiving (bytes_sent, total_bytes, display_name)
+                         as the files are uploaded
+        :return: URL as string (of the first report when sharded, or the first error returned)
         """
+        base_files, files = self.base_files, self.files
+        if self.deduplicate:
+            if self.debug:
+                print('looking for duplicate files...')
+            base_files, files, self.duplicates, self.saved_bytes = find_duplicates(
+                self.base_files, self.files, self.normalise_whitespace, bool(self.options['d']),
+                ignore_limit=self.options['m'], digests=self.digests)
+            if self.debug:
+                print(f'skipping {len(self.base_files) + len(self.files) - len(base_files) - len(files)} '
+                      f'duplicate files ({self.saved_bytes} bytes)')
+        past_files = [file for file in files if source_key(file[0]) in self.past_files]
+        if self.shards > 1 and past_files:
+            current_files = [file for file in files if source_key(file[0]) not in self.past_files]
+            submissions = [current_files + partition for partition in partition_files(past_files, self.shards)]
+        else:
+            submissions = [files]
         if self.debug:
-            print('sending submission...')
-        self.url = mosspy.Moss.send(self)
+            print(f'sending submission{f" in {len(submissions)} shards" if len(submissions) > 1 else ""}...')
+        uploader = SubmissionUploader(self.server, self.port, self.upload_chunk_size)
+        if len(submissions) == 1:
+            urls = [uploader.upload(self.user_id, self.options, base_files, files, progress)]
+        else:
+            shard_sent = [0] * len(submissions)
+            total = sum(source_size(file_path) for shard_files in [base_files] * len(submissions) + submissions
+                        for file_path, _ in shard_files)
+            progress_lock = threading.Lock()
+
+            def _upload(shard: int) -> str:
+                def _progress(sent: int, _, display_name: str):
+                    with progress_lock:
+                        shard_sent[shard] = sent
+                        progress(sum(shard_sent), total, display_name)
+
+                return uploader.upload(self.user_id, self.options, base_files, submissions[shard],
+                                       _progress if progress is not None else None)
+
+            with ThreadPoolExecutor(max_workers=len(submissions)) as executor:
+                urls = list(executor.map(_upload, range(len(submissions))))
+        failed = [url for url in urls if not url.startswith('http')]
+        self.url = failed[0] if failed else urls[0]
+        self.shard_urls = [] if failed or len(urls) == 1 else urls
         self.sent = True
         return self.url
 
@@ -0,0 +1,179 @@
+"""
+Headless front end for MossUCI, for cron jobs and batch processing of
+several course sections without starting the GUI.
+
+Usage:
+    python -m moss_cli manifest.json [manifest.json ...] [--jobs N] [--debug]
+    python -m moss_cli --diff old/report.snapshot new/report.snapshot
+
+A manifest is a JSON file describing one submission:
+    {
+        "moss_id": 123456789,
+        "language": "python",
+        "ignore_limit": 10,
+        "directory_mode": false,
+        "shards": 1,
+        "base": [{"type": "single", "path": "starter.py", "name": "starter.py"}],
+        "current": [{"type": "directory_of_zip", "path": "submissions", "regex": "(.*)_",
+                     "filename": "lab1.py"}],
+        "past": [{"type": "wildcard", "path": "archive/**/*.py", "regex": "(.*)"}],
+        "past_corpus": true,
+        "partners": {"path_to_csv": "partners.csv", "assignment_number": "1"},
+        "report": {"directory": "reports", "filter": true, "archive": false, "zip": false,
+                   "network_threshold": -1, "page_size": 0, "export": ["jsonl", "csv", "snapshot"]}
+    }
+File sources take the same types as the Files tab (see file_sources.SELECTION_TYPES);
+"name" is the display name of a single file, "prefix" that of a checkmate directory and
+"regex" the display name regex of every other type. The "assignment_number" of "partners" may
+list several assignments (or separate them by commas) to combine their partners. "partners" may
+also be a list of pairs, and a manifest with a "url" re-filters an existing report instead of
+submitting ("url" may be a list holding the reports of every shard). "shards" splits the past students into that many
+concurrent submissions whose reports are merged (see MossUCI.send).
+"past_corpus" adds every file of the past student corpus index (see file_sources.PastCorpus),
+either the GUI's index when true or the index file at the given path. A report "page_size"
+above 0 writes a paginated report (see MossUCI.report_page_size), and "export" lists the
+machine readable files written next to it (see model.EXPORT_FORMATS). A manifest with a
+"snapshot" re-filters the report saved in that report.snapshot file, without downloading it again.
+Relative paths are resolved against the manifest's directory.
+"""
+import argparse
+import json
+import pathlib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import model
+from file_sources import PastCorpus, collect_files
+
+REPORT_DEFAULTS = {'directory': '.', 'filter': True, 'archive': False, 'zip': False, 'network_threshold': -1,
+                   'page_size': 0, 'export': []}
+
+
+def _resolve(root: pathlib.Path, path: str) -> str:
+    return str(root.joinpath(pathlib.Path(path).expanduser()))
+
+
+def load_partners(spec, root: pathlib.Path) -> model.PartnerIndex:
+    """
+    :param spec: list of partner pairs, or keyword arguments for scripts.partner_converter.partner_formatter
+    :param root: directory relative paths are resolved against
+    :return: model.PartnerIndex of the partnered pairs
+    """
+    if not spec:
+        return model.PartnerIndex()
+    if isinstance(spec, dict):
+        from scripts.partner_converter import partner_formatter
+        spec = dict(spec, path_to_csv=_resolve(root, spec['path_to_csv']))
+        return model.PartnerIndex.of(partner_formatter(**spec))
+    return model.PartnerIndex(spec)
+
+
+def run_manifest(manifest_path: str, debug=False) -> (str, pathlib.Path):
+    """
+    Submits (or re-filters) the report described by a manifest.
+    :param manifest_path: path to the JSON manifest
+    :param debug: print MossUCI progress messages
+    :return: tuple of the report url (space separated urls when sharded) and the path of the generated report
+    """
+    manifest_path = pathlib.Path(manifest_path).resolve()
+    root = manifest_path.parent
+    with manifest_path.open() as manifest_file:
+        manifest = json.load(manifest_file)
+    report = dict(REPORT_DEFAULTS, **manifest.get('report', {}))
+    partners = load_partners(manifest.get('partners'), root)
+
+    moss = model.MossUCI(manifest.get('moss_id', 0), manifest.get('language', 'python'), debug=debug)
+    moss.setIgnoreLimit(manifest.get('ignore_limit', moss.options['m']))
+    moss.setDirectoryMode(1 if manifest.get('directory_mode') else 0)
+    moss.shards = manifest.get('shards', 1)
+    moss.report_page_size = report['page_size']
+    moss.export_formats = report['export']
+
+    records = []
+    for group in model.FILE_GROUPS:
+        for source in manifest.get(group, []):
+            selection_type = source['type']
+            path = _resolve(root, source['path'])
+            name = source.get('name', source.get('prefix', source.get('regex', '(.*)')))
+            records += [model.FileRecord(file_path, display_name.replace(' ', '_'), group)
+                        for file_path, display_name in collect_files(path, name, selection_type,
+                                                                     source.get('filename', ''),
+                                                                     source.get('dir_mode', False))]
+    corpus = manifest.get('past_corpus')
+    if corpus:
+        records += PastCorpus(model.CORPUS_FILE if corpus is True else _resolve(root, corpus)).records()
+    moss.add_records(records)
+
+    if manifest.get('snapshot'):
+        moss.load_snapshot(_resolve(root, manifest['snapshot']))
+        if not moss.current_quarter_students:
+            moss.deactivate_current_students()
+    elif manifest.get('url'):
+        moss.sent = True
+        urls = manifest['url'] if isinstance(manifest['url'], list) else [manifest['url']]
+        moss.shard_urls = [url.rstrip('/') for url in urls]
+        moss.url = moss.shard_urls[0]
+        if not moss.current_quarter_students:
+            moss.deactivate_current_students()
+    else:
+        url = moss.send()
+        if url.startswith('Error') or not url:
+            raise ConnectionError(url or 'No url returned by the MOSS server')
+
+    report_directory = pathlib.Path(_resolve(root, report['directory']))
+    report_directory.mkdir(parents=True, exist_ok=True)
+    report_path = moss.filter_report(path=str(report_directory), partners=partners, archive=report['archive'],
+                                     zip_report=report['zip'], network_threshold=report['network_threshold'],
+                                     to_filter=report['filter'])
+    return ' '.join(moss.shard_urls) or moss.url, report_path
+
+
+def diff_snapshots(old_path: str, new_path: str) -> [str]:
+    """
+    :param old_path: report.snapshot of the earlier report
+    :param new_path: report.snapshot of the later report
+    :return: a line for every match added (+), removed (-) or whose number of lines matched changed (~)
+    """
+    added, removed, changed = model.ReportSnapshot.load(old_path).diff(model.ReportSnapshot.load(new_path))
+    return ([f'+ {match.student1} {match.student2} {match.lines}' for match in added] +
+            [f'- {match.student1} {match.student2} {match.lines}' for match in removed] +
+            [f'~ {new.student1} {new.student2} {old.lines} -> {new.lines}' for old, new in changed])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m moss_cli', description='Submit and filter MOSS reports '
+                                                                            'without the GUI.')
+    parser.add_argument('manifests', nargs='*', help='JSON manifests describing each submission')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of manifests to process at once')
+    parser.add_argument('--debug', action='store_true', help='print progress messages')
+    parser.add_argument('--clear-cache', action='store_true', help='delete the cached MOSS result pages first')
+    parser.add_argument('--update-corpus', action='store_true', help='re-index the new or modified files of the '
+                                                                     'past student corpus first')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help='compare the matches of two report snapshots')
+    args = parser.parse_args(argv)
+    if not args.manifests and not (args.clear_cache or args.update_corpus or args.diff):
+        parser.error('at least one manifest is required')
+    if args.diff:
+        for line in diff_snapshots(*args.diff):
+            print(line)
+    if args.clear_cache:
+        model.PageCache().invalidate()
+    if args.update_corpus:
+        print('past student corpus: added {}, updated {} and removed {} files'.format(*PastCorpus().refresh()))
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [(manifest, executor.submit(run_manifest, manifest, args.debug)) for manifest in args.manifests]
+        for manifest, future in futures:
+            try:
+                url, report_path = future.result()
+            except Exception as e:
+                failures += 1
+                print(f'{manifest}: failed: {e}', file=sys.stderr)
+            else:
+                print(f'{manifest}: {url} -> {report_path}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
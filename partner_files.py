@@ -0,0 +1,211 @@
+"""
+Tk-free reading of partner files, used as the default partner handler
+when scripts.partner_converter cannot be imported.
+The format is sniffed from the start of the file: a JSON list of pairs
+(or an object mapping each student to their partner), a Python literal
+of pairs or sets of partners as the previous default handler expected,
+a class roster (read for the assignments asked for), or a delimited
+file (CSV, TSV, ...) with a student in the first column and their
+partner in the second.
+Class rosters listing every student's partner for each assignment are
+read by read_roster (see PartnerRoster), which scripts.partner_converter
+uses too.
+Partners may be given by e-mail address: only the part before the @ is
+the student's name.
+model (and so mosspy and jinja2) is only imported once partners are
+built, so the converter script can import this module on its own.
+"""
+import ast
+import csv
+import itertools
+import json
+import os
+from functools import lru_cache
+
+SAMPLE_SIZE = 64 * 1024
+
+
+def _partner_index(pairs=()) -> 'model.PartnerIndex':
+    import model
+    return model.PartnerIndex(pairs)
+
+
+def student_name(cell: str) -> str:
+    """
+    :param cell: cell naming a student, possibly by e-mail address
+    :return: the student's name (the part before any @), without surrounding whitespace
+    """
+    return cell.strip().split('@')[0].strip()
+
+
+def _literal(node):
+    """
+    Evaluates a literal as ast.literal_eval does, also accepting the
+        set(...) and frozenset(...) calls the previous eval based handler
+        read; sets of names are returned as lists.
+    """
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('set', 'frozenset') \
+            and len(node.args) <= 1 and not node.keywords:
+        return _literal(node.args[0]) if node.args else []
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [_literal(element) for element in node.elts]
+    if isinstance(node, ast.Dict):
+        return {_literal(key): _literal(value) for key, value in zip(node.keys, node.values)}
+    return ast.literal_eval(node)
+
+
+def _pairs(partners):
+    """
+    :param partners: parsed JSON or literal: pairs of names, or a mapping of each student to a partner
+                     (or list of partners)
+    :return: generator of (student, partner)
+    """
+    if isinstance(partners, dict):
+        for student, partner in partners.items():
+            for other in ([partner] if isinstance(partner, str) else partner):
+                yield student_name(student), student_name(other)
+    else:
+        for group in partners:
+            yield from itertools.combinations([student_name(name) for name in group], 2)
+
+
+def _read_delimited(partner_file, sample: str) -> 'model.PartnerIndex':
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',\t;|')
+    except csv.Error:
+        dialect = csv.excel
+    partners = _partner_index()
+    for row in csv.reader(partner_file, dialect):
+        # The student and their partner; any further columns (ids, names, labs, ...) are ignored
+        if len(row) >= 2 and student_name(row[0]) and student_name(row[1]):
+            partners.add(student_name(row[0]), student_name(row[1]))
+    return partners
+
+
+def is_roster(sample: str) -> bool:
+    """
+    :param sample: start of a partner file
+    :return: whether the file is a class roster, whose header row starts with a StudentID column
+    """
+    first_row = next(csv.reader([sample.lstrip('\ufeff').partition('\n')[0]]), [])
+    return bool(first_row) and first_row[0].strip() == 'StudentID'
+
+
+@lru_cache(maxsize=16)
+def _load(path: str, mtime_ns: int, size: int):
+    with open(path, 'r', newline='') as partner_file:
+        sample = partner_file.read(SAMPLE_SIZE)
+        if is_roster(sample):
+            return _load_roster(path, mtime_ns, size, 1, 5)
+        if sample.lstrip()[:1] not in ('[', '{', '(') and not sample.lstrip().startswith(('set(', 'frozenset(')):
+            partner_file.seek(0)
+            return _read_delimited(partner_file, sample)
+        contents = sample + partner_file.read()
+    try:
+        partners = json.loads(contents)
+    except ValueError:
+        partners = _literal(ast.parse(contents.strip(), mode='eval').body)
+    return _partner_index(_pairs(partners))
+
+
+def load_partners(path_to_csv: str, assignment_number='') -> 'model.PartnerIndex':
+    """
+    Reads a partner file, sniffing its format. The parsed partners are
+        cached until the file is modified, so the same file is only read once.
+    :param path_to_csv: path to the partner file
+    :param assignment_number: for a class roster, the assignment to read the partners of, or several
+                              separated by commas to combine their partners (ignored by other formats)
+    :return: PartnerIndex of the partnered pairs
+    """
+    stat = os.stat(path_to_csv)
+    partners = _load(os.path.abspath(path_to_csv), stat.st_mtime_ns, stat.st_size)
+    if isinstance(partners, PartnerRoster):
+        if isinstance(assignment_number, str):
+            assignment_number = [number.strip() for number in assignment_number.split(',') if number.strip()]
+        if not assignment_number:
+            # Partners of one assignment are not partners on the others, so the roster is never read whole
+            raise ValueError(f'{path_to_csv} is a class roster: enter the assignment number(s) to read the partners '
+                             f'of (assignments: {", ".join(partners.assignments)})')
+        return partners.partners(assignment_number)
+    return partners
+
+
+class PartnerRoster:
+    """
+    A class roster parsed once into columns: the student of every row and,
+        for each assignment, the partner of every row.
+    The partners of any assignment, or of several at once, are then
+        gathered from the columns without reading the file again.
+    """
+
+    def __init__(self, students: [str], assignments: {str: [str]}):
+        """
+        :param students: student of every row
+        :param assignments: for every assignment (in roster order), the partner of every row ('' when none)
+        """
+        self.students = students
+        self.assignments = assignments
+        self._partners = dict()
+
+    def partners(self, assignments) -> 'model.PartnerIndex':
+        """
+        :param assignments: name of an assignment, or names of several to combine
+        :return: PartnerIndex of the pairs partnered in any of the assignments
+        """
+        assignments = frozenset([assignments] if isinstance(assignments, str) else assignments)
+        partners = self._partners.get(assignments)
+        if partners is None:
+            unknown = assignments - self.assignments.keys()
+            if unknown:
+                raise KeyError(f"No assignment {', '.join(sorted(unknown))} in the roster "
+                               f"(assignments: {', '.join(self.assignments)})")
+            partners = self._partners[assignments] = _partner_index(
+                (student, partner) for assignment in assignments
+                for student, partner in zip(self.students, self.assignments[assignment]) if partner)
+        return partners
+
+
+@lru_cache(maxsize=16)
+def _load_roster(path: str, mtime_ns: int, size: int, student_column: int,
+                 first_assignment_column: int) -> PartnerRoster:
+    with open(path, 'r', newline='') as roster_file:
+        # Only a header starting with StudentID is taken as one, rather than guessing
+        has_header = is_roster(roster_file.read(SAMPLE_SIZE))
+        roster_file.seek(0)
+        rows = csv.reader(roster_file)
+        header = next(rows, []) if has_header else []
+        students = []
+        columns = []
+        for row in rows:
+            if not row:
+                continue
+            students.append(student_name(row[student_column]))
+            cells = row[first_assignment_column:]
+            columns.extend([] for _ in range(len(cells) - len(columns)))
+            for column, cell in zip(columns, cells):
+                # Partners are listed by e-mail address
+                column.append(student_name(cell))
+            for column in columns[len(cells):]:
+                column.append('')
+    # Columns first seen on a later, wider row are missing the rows read before it
+    for column in columns:
+        column[:0] = [''] * (len(students) - len(column))
+    names = header[first_assignment_column:]
+    return PartnerRoster(students, {(names[number].strip() if number < len(names) else str(number + 1)): column
+                                    for number, column in enumerate(columns)})
+
+
+def read_roster(path_to_csv: str, student_column=1, first_assignment_column=5) -> PartnerRoster:
+    """
+    Reads a CSV class roster with a row per student and a column per
+        assignment holding the student's partner. The roster is cached until
+        the file is modified, so picking other assignments does not read it again.
+    :param path_to_csv: path to the roster
+    :param student_column: position of the column naming the student
+    :param first_assignment_column: position of the first assignment's column
+    :return: the parsed PartnerRoster, whose assignments are named by the header row (recognised by
+             its first cell, StudentID), or numbered from 1 when the roster has none
+    """
+    stat = os.stat(path_to_csv)
+    return _load_roster(os.path.abspath(path_to_csv), stat.st_mtime_ns, stat.st_size, student_column,
+                        first_assignment_column)
@@ -8,6 +8,7 @@ a set or similar container holding the student pairs.
 IMPORTANT:
         These names must match the submission names.
 """
+from partner_files import read_roster
 
 
 def partner_formatter(path_to_csv: str, assignment_number: str) -> {(str, str), }:
@@ -16,17 +17,12 @@ def partner_formatter(path_to_csv: str, assignment_number: str) -> {(str, str),
         representing partners.
     Assumes the column structure:
         "StudentID","UCInetID","Last Name","First Name","Lab","1","2","3","4","5","6","7","8","9","10"
+    The roster is parsed once (see partner_files.read_roster), so other
+        assignments are picked without reading the file again.
     :param path_to_csv: file path
-    :param assignment_number: assignment to look at
+    :param assignment_number: assignment to look at, or several separated by commas to combine their partners
     :return: list of partners
     """
-    assignment_number = int(assignment_number)
-    a_set = set()
-    with open(path_to_csv, 'r') as part_file:
-        for line in part_file:
-            line = line.rstrip()
-            if line == '"StudentID","UCInetID","Last Name","First Name","Lab","1","2","3","4","5","6","7","8","9","10"':
-                continue
-            line = line.split(',')
-            a_set.add(frozenset((line[1].strip('"'), line[assignment_number + 4].strip('"').split('@')[0])))
-    return a_set
+    if isinstance(assignment_number, str):
+        assignment_number = [number.strip() for number in assignment_number.split(',')]
+    return read_roster(path_to_csv, student_column=1, first_assignment_column=5).partners(assignment_number)
@@ -0,0 +1,82 @@
+"""
+Checks which files model.find_duplicates leaves out of a submission and
+how model.expand_duplicates adds them back to the report.
+"""
+import pathlib
+import tempfile
+import unittest
+
+import model
+
+
+class FindDuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, name: str, contents: str) -> str:
+        path = self.root.joinpath(name)
+        path.write_text(contents)
+        return str(path)
+
+    def _students(self, count: int, contents='print("starter")\n') -> [(str, str)]:
+        return [(self._write(f'student{number}.py', contents), f'student{number}/main.py') for number in range(count)]
+
+    def test_copies_within_the_ignore_limit_are_all_uploaded(self):
+        files = self._students(4)
+        _, kept, duplicates, saved = model.find_duplicates([], files, ignore_limit=3)
+        self.assertEqual(kept, files)
+        self.assertEqual((duplicates, saved), ({}, 0))
+
+    def test_copies_beyond_the_ignore_limit_are_dropped(self):
+        files = self._students(6)
+        _, kept, duplicates, saved = model.find_duplicates([], files, ignore_limit=3)
+        # MOSS still sees ignore_limit + 1 copies, so it ignores their contents as it would with all six
+        self.assertEqual(kept, files[:4])
+        self.assertEqual(saved, 2 * len('print("starter")\n'))
+        self.assertEqual(duplicates, {model.source_key(files[0][0]): model.DuplicateGroup(
+            'student0/main.py', 1, ['student4/main.py', 'student5/main.py'],
+            ['student1/main.py', 'student2/main.py', 'student3/main.py'])})
+
+    def test_shared_display_names_are_never_dropped(self):
+        files = [(path, 'student') for path, _ in self._students(6)]
+        _, kept, duplicates, _ = model.find_duplicates([], files, ignore_limit=3)
+        self.assertEqual((kept, duplicates), (files, {}))
+
+    def test_files_added_twice_and_copies_of_base_files_are_dropped(self):
+        base = self._write('base.py', 'given = True\n')
+        files = self._students(1, 'mine = True\n') + [(base, 'student1/main.py')]
+        kept_base, kept, duplicates, saved = model.find_duplicates([(base, 'base.py'), (base, 'base.py')],
+                                                                   files + files[:1])
+        self.assertEqual((kept_base, kept, duplicates), ([(base, 'base.py')], files[:1], {}))
+        self.assertEqual(saved, 2 * len('given = True\n') + len('mine = True\n'))
+
+    def test_stored_digests_are_used_instead_of_reading_the_files(self):
+        files = self._students(5)
+        # The archive does not exist, so these files could only be compared through their stored digests
+        stored = [(model.ZipMember(str(self.root.joinpath('past.zip')), f'past{number}/main.py', 17),
+                   f'past{number}/main.py') for number in range(2)]
+        digests = {model.source_key(file_path): model.StoredDigests.of(files[0][0]) for file_path, _ in stored}
+        _, kept, duplicates, saved = model.find_duplicates([], files + stored, ignore_limit=3, digests=digests)
+        self.assertEqual(kept, files[:4])
+        self.assertEqual(saved, 3 * 17)
+        self.assertEqual(duplicates[model.source_key(files[0][0])].copies,
+                         ['student4/main.py', 'past0/main.py', 'past1/main.py'])
+
+    def test_expand_adds_one_row_per_copy(self):
+        files = self._students(6)
+        _, _, duplicates, _ = model.find_duplicates([], files, ignore_limit=3)
+        match = model.MatchRecord('http://moss.stanford.edu/results/1/2/match0.html', 0, 'student0/main.py', 90,
+                                  'other/main.py', 80, 12)
+        expanded = model.expand_duplicates([match], duplicates)
+        self.assertEqual(expanded[:3], [match, match._replace(student1='student4/main.py'),
+                                        match._replace(student1='student5/main.py')])
+        self.assertEqual([(row.student1, row.student2) for row in expanded[3:]],
+                         [('student0/main.py', f'student{number}/main.py') for number in (1, 2, 3, 4, 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
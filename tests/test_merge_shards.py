@@ -0,0 +1,41 @@
+"""
+Checks how model.merge_shards combines the reports of a sharded submission.
+"""
+import unittest
+
+import model
+
+
+def _match(shard: int, number: int, student1: str, student2: str, lines: int) -> model.MatchRecord:
+    return model.MatchRecord(f'http://moss.stanford.edu/results/1/{shard}/match{number}.html', str(number),
+                             student1, 90, student2, 80, lines)
+
+
+class MergeShardsTest(unittest.TestCase):
+    def test_several_matches_between_the_same_names_are_kept(self):
+        first = model.MatchTable([_match(1, 0, 'alice', 'bob', 200), _match(1, 1, 'alice', 'bob', 80)])
+        second = model.MatchTable([_match(2, 0, 'alice', 'past', 120), _match(2, 1, 'past', 'alice', 40)])
+        merged = model.merge_shards([first, second], {'alice', 'bob'})
+        self.assertEqual([(match.student1, match.student2, match.lines) for match in merged],
+                         [('alice', 'bob', 200), ('alice', 'past', 120), ('alice', 'bob', 80), ('past', 'alice', 40)])
+
+    def test_current_students_are_only_kept_from_the_first_shard(self):
+        first = model.MatchTable([_match(1, 0, 'alice', 'bob', 200), _match(1, 1, 'alice', 'bob', 80),
+                                  _match(1, 2, 'bob', 'old1', 30)])
+        second = model.MatchTable([_match(2, 0, 'alice', 'bob', 200), _match(2, 1, 'alice', 'bob', 80),
+                                   _match(2, 2, 'bob', 'old2', 50), _match(2, 3, 'old2', 'old3', 20)])
+        merged = model.merge_shards([first, second], {'Alice', 'Bob'})
+        self.assertEqual([(match.student1, match.student2, match.lines, match.url.split('/')[-2]) for match in merged],
+                         [('alice', 'bob', 200, '1'), ('alice', 'bob', 80, '1'), ('bob', 'old2', 50, '2'),
+                          ('bob', 'old1', 30, '1'), ('old2', 'old3', 20, '2')])
+
+    def test_directory_mode_names_are_current(self):
+        first = model.MatchTable([_match(1, 0, 'alice/', 'bob/', 200)])
+        second = model.MatchTable([_match(2, 0, 'alice/', 'bob/', 200), _match(2, 1, 'alice/', 'old/', 10)])
+        merged = model.merge_shards([first, second], {'alice/main.py', 'bob/main.py'})
+        self.assertEqual([(match.student1, match.student2) for match in merged],
+                         [('alice/', 'bob/'), ('alice/', 'old/')])
+
+
+if __name__ == '__main__':
+    unittest.main()
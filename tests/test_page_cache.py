@@ -0,0 +1,57 @@
+"""
+Checks the size bookkeeping and eviction of model.PageCache.
+"""
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import model
+
+
+def _url(number: int) -> str:
+    return f'http://moss.stanford.edu/results/1/{number}/match0.html'
+
+
+class PageCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = model.PageCache(self.directory.name, max_bytes=10000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _cached_bytes(self) -> int:
+        return sum(page.stat().st_size for page in pathlib.Path(self.directory.name).glob('*/*.html'))
+
+    def test_eviction_goes_down_to_the_low_water_mark(self):
+        scans = []
+        entries = model.PageCache._entries
+        with mock.patch.object(model.PageCache, '_entries', (lambda cache: scans.append(1) or entries(cache))):
+            for number in range(100):
+                self.cache.put(_url(number), b'x' * 100)
+            self.assertEqual(self._cached_bytes(), 10000)
+            scans.clear()
+            self.cache.put(_url(100), b'x' * 100)
+            self.assertEqual(self._cached_bytes(), 9000)
+            # The following writes fit under max_bytes again without looking at the cached pages
+            for number in range(101, 110):
+                self.cache.put(_url(number), b'x' * 100)
+        self.assertEqual(len(scans), 1)
+        self.assertIsNone(self.cache.get(_url(0)))
+        self.assertEqual(self.cache.get(_url(109)), b'x' * 100)
+
+    def test_usage_is_shared_by_every_instance_of_a_directory(self):
+        other = model.PageCache(self.directory.name, max_bytes=10000)
+        for number in range(60):
+            self.cache.put(_url(number), b'x' * 100)
+        other.invalidate()
+        for number in range(60, 120):
+            self.cache.put(_url(number), b'x' * 100)
+        # Nothing was evicted, as the pages removed by the other instance are no longer counted
+        self.assertEqual(self._cached_bytes(), 6000)
+        self.assertEqual(self.cache.get(_url(60)), b'x' * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
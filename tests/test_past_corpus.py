@@ -0,0 +1,64 @@
+"""
+Checks how file_sources.PastCorpus keeps its index up to date.
+"""
+import json
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import file_sources
+import model
+
+
+class PastCorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.directory.name)
+        self.submissions = self.root.joinpath('submissions')
+        self.submissions.mkdir()
+        self.corpus = file_sources.PastCorpus(self.root.joinpath('corpus.json'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, name: str, contents: str, mtime: int) -> str:
+        path = self.submissions.joinpath(name)
+        path.write_text(contents)
+        os.utime(path, (mtime, mtime))
+        return str(path)
+
+    def test_refresh_only_hashes_new_and_changed_files(self):
+        first = self._write('alice.py', 'x  = 1\n', 1000)
+        self._write('bob.py', 'y = 2\n', 1000)
+        self.assertEqual(self.corpus.add_source(str(self.submissions), '(.*)', 'directory'), (2, 0, 0))
+
+        self._write('bob.py', 'y = 3\n', 2000)
+        self._write('carol.py', 'z = 4\n', 1000)
+        with mock.patch.object(model.StoredDigests, 'of', wraps=model.StoredDigests.of) as hashed:
+            self.assertEqual(self.corpus.refresh(), (1, 1, 0))
+        self.assertEqual(sorted(pathlib.Path(call[0][0]).name for call in hashed.call_args_list),
+                         ['bob.py', 'carol.py'])
+
+        records = {record.display_name: record for record in file_sources.PastCorpus(self.corpus.index_path).records()}
+        self.assertEqual(records['alice.py'].digests, model.StoredDigests.of(first))
+        self.assertEqual(records['alice.py'].digests.fingerprint(7), model.fingerprint(first))
+        self.assertEqual(records['bob.py'].digests.fingerprint(6, False),
+                         model.fingerprint(self.submissions.joinpath('bob.py'), False))
+
+    def test_entries_without_digests_are_hashed(self):
+        path = self._write('alice.py', 'x = 1\n', 1000)
+        self.corpus.add_source(str(self.submissions), '(.*)', 'directory')
+        index = json.loads(self.corpus.index_path.read_text())
+        del index['sources'][0]['files'][path]['digests']
+        self.corpus.index_path.write_text(json.dumps(index))
+
+        corpus = file_sources.PastCorpus(self.corpus.index_path)
+        self.assertEqual(corpus.records()[0].digests, None)
+        self.assertEqual(corpus.refresh(), (0, 0, 0))
+        self.assertEqual(corpus.records()[0].digests, model.StoredDigests.of(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
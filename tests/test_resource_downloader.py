@@ -0,0 +1,104 @@
+"""
+Runs model.ResourceDownloader against a local HTTP stand-in for the
+MOSS results server.
+"""
+import http.server
+import pathlib
+import tempfile
+import threading
+import unittest
+
+import model
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            failures = server.failures.get(self.path, 0)
+            if failures:
+                server.failures[self.path] = failures - 1
+        if failures:
+            status, body = 503, b'busy'
+        elif self.path.startswith('/missing'):
+            status, body = 404, b'not found'
+        else:
+            status, body = 200, f'<html>{self.path}</html>'.encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        # Number of 503 responses to give before answering a path
+        self.failures = {}
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class ResourceDownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.directory = tempfile.TemporaryDirectory()
+        self.destination = pathlib.Path(self.directory.name)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_download_saves_every_page_over_pooled_connections(self):
+        downloader = model.ResourceDownloader(workers=3, request_interval=0)
+        jobs = [(f'{self.url}/results/1/match{number}.html', self.destination.joinpath(f'match{number}.html'),
+                 (lambda contents: contents.upper()) if number == 0 else None) for number in range(12)]
+        progress = []
+        downloader.download(jobs, (lambda completed, total, destination: progress.append((completed, total))))
+
+        self.assertEqual(self.destination.joinpath('match0.html').read_text(), '<HTML>/RESULTS/1/MATCH0.HTML</HTML>')
+        self.assertEqual(self.destination.joinpath('match11.html').read_text(), '<html>/results/1/match11.html</html>')
+        self.assertEqual(progress, [(completed, 12) for completed in range(1, 13)])
+        # Keep-alive connections are reused: at most one per worker
+        self.assertLessEqual(self.server.connections, 3)
+
+    def test_server_errors_are_retried(self):
+        self.server.failures['/results/1/match0.html'] = 2
+        downloader = model.ResourceDownloader(workers=1, request_interval=0, retries=2, backoff=0)
+        self.assertEqual(downloader.fetch(f'{self.url}/results/1/match0.html'), b'<html>/results/1/match0.html</html>')
+        self.assertEqual(self.server.requests.count('/results/1/match0.html'), 3)
+
+    def test_client_errors_are_not_retried(self):
+        downloader = model.ResourceDownloader(workers=1, request_interval=0, retries=2, backoff=0)
+        with self.assertRaises(ValueError):
+            downloader.fetch(f'{self.url}/missing.html')
+        self.assertEqual(self.server.requests, ['/missing.html'])
+
+    def test_failed_download_raises(self):
+        self.server.failures['/results/1/match1.html'] = 10
+        downloader = model.ResourceDownloader(workers=2, request_interval=0, retries=1, backoff=0)
+        jobs = [(f'{self.url}/results/1/match{number}.html', self.destination.joinpath(f'match{number}.html'), None)
+                for number in range(3)]
+        with self.assertRaises(ConnectionError):
+            downloader.download(jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Runs model.SubmissionUploader against a local stand-in for the MOSS
+submission server.
+"""
+import pathlib
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+import mosspy
+
+import model
+
+REPORT_URL = 'http://moss.stanford.edu/results/7/123456'
+
+
+class StandInHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        submission = {'commands': [], 'files': []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line.decode().rstrip('\n')
+            submission['commands'].append(command)
+            parts = command.split(' ', 4)
+            if parts[0] == 'language':
+                self.wfile.write(b'yes\n' if parts[1] in server.languages else b'no\n')
+            elif parts[0] == 'file':
+                contents = self.rfile.read(int(parts[3]))
+                submission['files'].append((int(parts[1]), parts[2], parts[4], contents))
+            elif parts[0] == 'query':
+                self.wfile.write(f'{REPORT_URL}\n'.encode())
+            elif parts[0] == 'end':
+                break
+        with server.lock:
+            server.submissions.append(submission)
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, languages=('python',)):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.languages = languages
+        self.submissions = []
+
+
+class SubmissionUploaderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.serving = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.serving.start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = pathlib.Path(self.directory.name)
+        self.uploader = model.SubmissionUploader('127.0.0.1', self.server.server_address[1], chunk_size=7,
+                                                 read_ahead=2, timeout=10)
+        self.options = dict(mosspy.Moss('1', 'python').options)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def _write(self, name: str, contents: bytes) -> str:
+        path = self.root.joinpath(name)
+        path.write_bytes(contents)
+        return str(path)
+
+    def _received(self) -> dict:
+        # The handler finishes after the client has closed the connection
+        for _ in range(100):
+            with self.server.lock:
+                if self.server.submissions:
+                    return self.server.submissions[0]
+            time.sleep(0.05)
+        self.fail('The stand-in server received no submission')
+
+    def test_upload_sends_every_file_and_returns_the_report_url(self):
+        archive = self.root.joinpath('submissions.zip')
+        with zipfile.ZipFile(archive, 'w') as archive_file:
+            archive_file.writestr('bob/main.py', 'print("bob")\n' * 5)
+        base = self._write('base.py', b'# given to every student\n')
+        alice = self._write('alice.py', b'print("alice")\n' * 4)
+        files = [(alice, 'alice/main.py'), (model.ZipMember(str(archive), 'bob/main.py'), 'bob/main.py')]
+        progress = []
+
+        url = self.uploader.upload(42, self.options, [(base, 'base.py')], files,
+                                   (lambda sent, total, name: progress.append((sent, total, name))))
+
+        self.assertEqual(url, REPORT_URL)
+        received = self._received()
+        self.assertEqual(received['commands'][:6], ['moss 42', 'directory 0', 'X 0', 'maxmatches 10', 'show 250',
+                                                    'language python'])
+        self.assertEqual(received['files'], [(0, 'python', 'base.py', b'# given to every student\n'),
+                                             (1, 'python', 'alice/main.py', b'print("alice")\n' * 4),
+                                             (2, 'python', 'bob/main.py', b'print("bob")\n' * 5)])
+        self.assertEqual(received['commands'][-2:], ['query 0 ', 'end'])
+        total = sum(len(contents) for _, _, _, contents in received['files'])
+        self.assertEqual(progress[-1], (total, total, 'bob/main.py'))
+        self.assertEqual([sent for sent, _, _ in progress], sorted(sent for sent, _, _ in progress))
+        self.assertEqual({name for _, _, name in progress}, {'base.py', 'alice/main.py', 'bob/main.py'})
+
+    def test_unnamed_files_are_submitted_under_their_path(self):
+        path = self._write('with space.py', b'x = 1\n')
+        self.uploader.upload(1, self.options, [], [(path, None)])
+        self.assertEqual(self._received()['files'], [(1, 'python', path.replace(' ', '_'), b'x = 1\n')])
+
+    def test_rejected_language_raises(self):
+        self.options['l'] = 'cobol'
+        path = self._write('main.py', b'x = 1\n')
+        with self.assertRaises(ValueError):
+            self.uploader.upload(1, self.options, [], [(path, 'main.py')])
+        received = self._received()
+        self.assertEqual(received['files'], [])
+        self.assertEqual(received['commands'][-1], 'end')
+
+
+if __name__ == '__main__':
+    unittest.main()